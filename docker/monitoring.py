@@ -21,7 +21,7 @@ LOG_FILE = 'server_monitoring.log'  # Log file name
 #                         Helper Functions                           #
 ######################################################################
 def get_env_variables() -> Dict[str, str]:
-    env_vars = ["RCON_PORT", "API_URL", "RCON_PASS" , "PROMETHEUS_PORT"]
+    env_vars = ["RCON_PORT", "API_URL", "RCON_PASS" , "PROMETHEUS_PORT", "SERVER_ID", "API_TOKEN"]
     return {var: os.getenv(var) for var in env_vars}
 
 ######################################################################
@@ -74,8 +74,14 @@ class MONITOR:
         self.check_interval = check_interval
         self.api_url = api_url
         self.rcon_pass = rcon_pass
+        self.server_id = envs.get('SERVER_ID') or "default" # The server's id in the API's registry
+        self.api_token = envs.get('API_TOKEN') or None # Bearer token, unset when the API isn't authorized
         self.inactive_players_timer_start = None
 
+        # Status snapshot, the sequence number changes when the published status does
+        self.snapshot_seq = 0
+        self.last_snapshot_state = None
+
         # Promtheus Metrics
         self.online_players_gauge = Gauge('minecraft_online_players', 'Number of online players')
         self.server_up_gauge = Gauge('minecraft_server_up', 'Whether the server is up')
@@ -100,12 +106,14 @@ class MONITOR:
             'version': version
         }
     
-    def send_to_api(self, command):
-        MAX_RETRIES = 3
+    def send_to_api(self, command, payload=None, max_retries=3):
+        MAX_RETRIES = max_retries
         TIMEOUT = 5  # seconds
 
         headers = {'Content-Type': 'application/json'}
-        data =  { "action": command }
+        if self.api_token:
+            headers['Authorization'] = f"Bearer {self.api_token}"
+        data =  { "action": command, "server_id": self.server_id, **(payload or {}) }
 
         log_data = {
             "api_command": command,
@@ -147,6 +155,27 @@ class MONITOR:
 
         return None
 
+    def publish_snapshot(self, data):
+        """
+        Publish a compact status snapshot, status requests are answered from it while it is fresh.
+        """
+        state = (data["server_online"], data["players_online"], data["server_version"], data["timer_status"])
+        if state != self.last_snapshot_state:
+            self.snapshot_seq += 1
+            self.last_snapshot_state = state
+
+        snapshot = {
+            "seq": self.snapshot_seq,
+            "timestamp": data["timestamp"],
+            "online": data["server_online"],
+            "players_online": data["players_online"],
+            "version": data["server_version"],
+            "time_without_players": data["time_without_players"],
+            "timer_status": data["timer_status"]
+        }
+        # Published every check, a missed snapshot is replaced by the next one
+        return self.send_to_api("status_snapshot", { "snapshot": snapshot, "server_id": self.server_id }, max_retries=1)
+
     def get_inactive_time_string(self):
         minutes, seconds = divmod(self.inactive_time, 60)
         return f"{minutes} minutes {seconds} seconds"
@@ -181,6 +210,8 @@ class MONITOR:
                     data = self.log.format_data(server_info['online'], server_info['players_online'], server_info['version'], 0, "RESET")
                     self.log.log(data)
 
+                self.publish_snapshot(data)
+
             except MonitorError:
                 self.log.log("Monitoring error occurred")
 
@@ -1,44 +1,228 @@
 # config/__init__.py
 
 import os
-from utils.aws import *
-from utils.git import GitUtil
-from utils.file_operations import write_to_tmp_file
-from utils.terraform import TerraformHelper, TerraformError
-
-# --- AWS ---
-AWS_REGION = get_region()
-
-# --- AWS SSM ---
-SSM_FARGATE_COMMAND_NAME = os.getenv('BOT_COMMAND_NAME')
-SSM_GIT_PRIVATE_KEY_NAME = os.getenv('GIT_PRIVATE_KEY')
-SSM_EC2_PRIVATE_KEY_NAME = os.getenv('EC2_PRIVATE_KEY')
-
-# --- Git ---
-GIT_REPO_NAME = "tf_manifests"
-GIT_REPO_URL = "git@github.com:Klyde-Moradeyo/minecraft-AWS-server.git"
-GIT_BRANCH = GitUtil.get_git_branch()
-SSH_KEY_STR = get_ssm_param(SSM_GIT_PRIVATE_KEY_NAME)
-GIT_REPO_CONFIG =   { 
-                        "name": GIT_REPO_NAME,
-                        "url": GIT_REPO_URL, 
-                        "branch": GIT_BRANCH,
-                        "paths": {
-                            "git_ssh_key": write_to_tmp_file(SSH_KEY_STR),
-                            "tf_mc_infra": os.path.join(GIT_REPO_NAME, "terraform", os.environ['ENVIRONMENT'], "minecraft_infrastructure"),
-                            "tf_mc_infra_handler": os.path.join(GIT_REPO_NAME, "terraform", os.environ['ENVIRONMENT'], "infrastructure_handler"),
-                            "tf_mc_infra_scripts": os.path.join(GIT_REPO_NAME, "scripts")
-                        }
-                    }
-
-# --- Terraform ---
-os.environ['TF_TOKEN_app_terraform_io'] = get_ssm_param(os.environ['TF_USER_TOKEN']) # Terraform Cloud Token
-
-# --- EC2 Login Details ---
-EC2_USERNAME = 'ubuntu'
-EC2_PRIVATE_KEY = get_ssm_param(SSM_EC2_PRIVATE_KEY_NAME)
-EC2_PRIVATE_KEY_PATH = write_to_tmp_file(EC2_PRIVATE_KEY)
-os.chmod(EC2_PRIVATE_KEY_PATH, 0o600)
-
-# --- Container's Job ---
-JOB = get_ssm_param(SSM_FARGATE_COMMAND_NAME)
+from functools import cached_property
+
+class ConfigError(ValueError):
+    pass
+
+# Secrets each job needs, by the environment variable naming their SSM parameter
+JOB_SECRETS = {
+    "start": ("GIT_PRIVATE_KEY", "TF_USER_TOKEN", "EC2_PRIVATE_KEY"),
+    "stop": ("GIT_PRIVATE_KEY", "TF_USER_TOKEN", "EC2_PRIVATE_KEY"),
+    "mc_world_archive": ("GIT_PRIVATE_KEY", "TF_USER_TOKEN"),
+}
+
+class Config:
+    """
+    Configuration of the TEC, read from the environment and SSM.
+
+    Importing it has no side effects: every field is resolved on first access, secrets are only
+    fetched by load_job_secrets() for the job that needs them (in one batched call) and private keys
+    are written to temporary files when they're first used. validate() checks the environment
+    without touching the network. AWS utils are imported on first use, so importing the config stays cheap.
+    """
+    REQUIRED_ENV_VARS = ("BOT_COMMAND_NAME", "GIT_PRIVATE_KEY", "EC2_PRIVATE_KEY", "TF_USER_TOKEN", "ENVIRONMENT")
+    INT_ENV_VARS = {
+        'GIT_CLONE_DEPTH': '1', # 0 clones the whole history
+        'SSH_READY_TIMEOUT': '600', # Seconds the instance created by apply has to boot and accept SSH
+        'REMOTE_SCRIPT_TIMEOUT': '1800', # Seconds a script on the instance may run before it is stopped
+        'LOCAL_SCRIPT_TIMEOUT': '3600', # Seconds mc_world_archiver.sh may run before it is stopped
+        'LOCAL_SCRIPT_IDLE_TIMEOUT': '900', # Seconds without output before it is considered stuck
+        'QUEUE_IDLE_GRACE_PERIOD': '120', # Seconds the task waits for new commands before exiting
+        'QUEUE_POLL_INTERVAL': '15',
+        'JOB_HEARTBEAT_INTERVAL': '60', # Seconds between heartbeats of the running job, under the Lambda's JOB_HEARTBEAT_TIMEOUT
+    }
+
+    # --- Git ---
+    GIT_REPO_NAME = "tf_manifests"
+    GIT_REPO_URL = "git@github.com:Klyde-Moradeyo/minecraft-AWS-server.git"
+
+    # --- EC2 Login Details ---
+    EC2_USERNAME = 'ubuntu'
+
+    def __init__(self, environ=None):
+        self.environ = os.environ if environ is None else environ
+
+    def validate(self):
+        """
+        Check the environment, reporting every problem at once. Raises ConfigError.
+        """
+        problems = [f"{name} is not set" for name in self.REQUIRED_ENV_VARS if not self.environ.get(name)]
+        for name, default in self.INT_ENV_VARS.items():
+            try:
+                int(self.environ.get(name, default))
+            except ValueError:
+                problems.append(f"{name} must be an integer, got '{self.environ[name]}'")
+        if self.environ.get('JOB_ID') and not self.environ['JOB_ID'].isdigit():
+            problems.append(f"JOB_ID must be an integer, got '{self.environ['JOB_ID']}'")
+        if self.environ.get('CHECKPOINT_BACKEND', 'ssm') not in ('ssm', 'local'):
+            problems.append(f"CHECKPOINT_BACKEND must be 'ssm' or 'local', got '{self.environ['CHECKPOINT_BACKEND']}'")
+        if self.environ.get('ENVIRONMENT'):
+            try:
+                self.GIT_BRANCH
+            except ValueError as e:
+                problems.append(str(e))
+
+        if problems:
+            raise ConfigError("Invalid configuration:\n  - " + "\n  - ".join(problems))
+
+    def _int(self, name):
+        return int(self.environ.get(name, self.INT_ENV_VARS[name]))
+
+    # --- AWS ---
+    @cached_property
+    def AWS_REGION(self):
+        from utils.aws import get_region
+        return get_region()
+
+    # --- AWS SSM ---
+    @property
+    def SSM_FARGATE_COMMAND_NAME(self):
+        return self.environ.get('BOT_COMMAND_NAME')
+
+    @property
+    def SSM_GIT_PRIVATE_KEY_NAME(self):
+        return self.environ.get('GIT_PRIVATE_KEY')
+
+    @property
+    def SSM_EC2_PRIVATE_KEY_NAME(self):
+        return self.environ.get('EC2_PRIVATE_KEY')
+
+    @property
+    def SSM_TF_USER_TOKEN_NAME(self):
+        return self.environ.get('TF_USER_TOKEN')
+
+    def load_job_secrets(self, command):
+        """
+        Fetch the secrets the job needs in one batched call and export the Terraform Cloud token.
+        Values are cached by the parameter store, the keys are read from there when first used.
+        """
+        from utils.aws import get_ssm_params
+        names = [self.environ[var] for var in JOB_SECRETS.get(command, ())]
+        secrets = get_ssm_params(names) if names else {}
+        if self.SSM_TF_USER_TOKEN_NAME in secrets:
+            os.environ['TF_TOKEN_app_terraform_io'] = secrets[self.SSM_TF_USER_TOKEN_NAME] # Terraform Cloud Token
+        return secrets
+
+    def _secret(self, param_name):
+        from utils.aws import get_ssm_param
+        return get_ssm_param(param_name)
+
+    def _write_key(self, param_name):
+        from utils.file_operations import write_to_tmp_file
+        path = write_to_tmp_file(self._secret(param_name))
+        os.chmod(path, 0o600)
+        return path
+
+    # --- Git ---
+    @cached_property
+    def GIT_BRANCH(self):
+        from utils.git import GitUtil
+        return GitUtil.get_git_branch(self.environ.get('ENVIRONMENT'))
+
+    @cached_property
+    def GIT_REPO_CONFIG(self):
+        environment = self.environ['ENVIRONMENT']
+        return  {
+                    "name": self.GIT_REPO_NAME,
+                    "url": self.GIT_REPO_URL,
+                    "branch": self.GIT_BRANCH,
+                    "paths": {
+                        "tf_mc_infra": os.path.join(self.GIT_REPO_NAME, "terraform", environment, "minecraft_infrastructure"),
+                        "tf_mc_infra_handler": os.path.join(self.GIT_REPO_NAME, "terraform", environment, "infrastructure_handler"),
+                        "tf_mc_infra_scripts": os.path.join(self.GIT_REPO_NAME, "scripts")
+                    },
+                    # Only these directories are checked out, terraform/ as a whole because modules are referenced by relative paths
+                    "sparse_paths": self.environ.get('GIT_SPARSE_PATHS', 'terraform,scripts').split(','),
+                    "depth": self._int('GIT_CLONE_DEPTH') or None,
+                    "mirror_dir": self.environ.get('GIT_MIRROR_DIR') or None # Reusable clone, fetched incrementally when the container is reused
+                }
+
+    @cached_property
+    def GIT_SSH_KEY_PATH(self):
+        return self._write_key(self.SSM_GIT_PRIVATE_KEY_NAME)
+
+    # --- EC2 Login Details ---
+    @cached_property
+    def EC2_PRIVATE_KEY_PATH(self):
+        return self._write_key(self.SSM_EC2_PRIVATE_KEY_NAME)
+
+    @property
+    def SSH_READY_TIMEOUT(self):
+        return self._int('SSH_READY_TIMEOUT')
+
+    @property
+    def REMOTE_SCRIPT_TIMEOUT(self):
+        return self._int('REMOTE_SCRIPT_TIMEOUT')
+
+    # --- Local Scripts ---
+    @property
+    def LOCAL_SCRIPT_TIMEOUT(self):
+        return self._int('LOCAL_SCRIPT_TIMEOUT')
+
+    @property
+    def LOCAL_SCRIPT_IDLE_TIMEOUT(self):
+        return self._int('LOCAL_SCRIPT_IDLE_TIMEOUT')
+
+    # --- Metrics ---
+    @property
+    def METRICS_NAMESPACE(self):
+        return self.environ.get('METRICS_NAMESPACE', 'MinecraftServer/TEC')
+
+    # --- Server ---
+    @property
+    def SERVER_ID(self):
+        return self.environ.get('SERVER_ID') or 'default' # The server's id in the API's registry, set by the Lambda
+
+    # --- API ---
+    @property
+    def AUTH_TOKEN_NAME(self):
+        return self.environ.get('AUTH_TOKEN_NAME') or None # Keyring the API checks tokens against, unset when it isn't authorized
+
+    @cached_property
+    def API_TOKEN(self):
+        if self.AUTH_TOKEN_NAME is None:
+            return None
+        from utils.api import load_api_token
+        return load_api_token(self.AUTH_TOKEN_NAME)
+
+    # --- Container's Job ---
+    @cached_property
+    def JOB(self):
+        return self._secret(self.SSM_FARGATE_COMMAND_NAME)
+
+    @property
+    def JOB_ID(self):
+        return int(self.environ['JOB_ID']) if self.environ.get('JOB_ID') else None # Set when the job was recorded in the job store
+
+    @cached_property
+    def JOB_STORE(self):
+        from utils.jobs import JobStore
+        return JobStore(self.SSM_FARGATE_COMMAND_NAME)
+
+    @property
+    def JOB_HEARTBEAT_INTERVAL(self):
+        return self._int('JOB_HEARTBEAT_INTERVAL')
+
+    @property
+    def LAUNCH_LOCK_OWNER(self):
+        return self.environ.get('LAUNCH_LOCK_OWNER') # Set by the Lambda that launched this task
+
+    # --- Job Checkpoints ---
+    @cached_property
+    def CHECKPOINT_BACKEND(self):
+        # Steps completed by a job that failed, kept in SSM or in a local directory when running outside AWS
+        from utils.checkpoints import get_checkpoint_backend
+        return get_checkpoint_backend(self.SSM_FARGATE_COMMAND_NAME, self.environ.get('CHECKPOINT_BACKEND', 'ssm'), self.environ.get('CHECKPOINT_DIR', '/tmp/tec-checkpoints'))
+
+    # --- Command Queue ---
+    @property
+    def QUEUE_IDLE_GRACE_PERIOD(self):
+        return self._int('QUEUE_IDLE_GRACE_PERIOD')
+
+    @property
+    def QUEUE_POLL_INTERVAL(self):
+        return self._int('QUEUE_POLL_INTERVAL')
+
+CONFIG = Config()
@@ -1,139 +1,261 @@
+import os
+import sys
+import threading
+import time
 import shutil
-from config import *
+from config import CONFIG, ConfigError
+from utils.aws import put_ssm_param, put_metric
+from utils.checkpoints import JobCheckpoint
+from utils.git import GitUtil
+from utils.guard import release_launch_lock
+from utils.jobs import JobStore
 from utils.logger import setup_logging
 from utils.ssh import SSHUtil
+from utils.steps import StepGraph
+from utils.terraform import TerraformHelper
 from utils.file_operations import *
 from utils.script_runner import *
 
 # Setting up logging
 logger = setup_logging()
 
+INSTANCE_MARKERS_DIR = "setup/markers" # Touched on the instance by the steps that ran there
+
 class ServerManager:
 
     def __init__(self):
         self.configured = self.check_configuration()
+        self.workspace_ready = False
+        self.terraform_helpers = {}
+        self.terraform_lock = threading.Lock() # Guards the helpers and init time updated by concurrent steps
+        self.job_init_seconds = 0.0 # Time the current job spent in terraform init
+        self.checkpoint = None # Steps completed by the current job, or by the same command's failed run
+        self.workspace_commit = None # tf_manifests commit the jobs run from
+        self.bot_command = None # Last value written to the bot command parameter, the launch command until then
 
     def check_configuration(self):
-        # Check for required configurations
-        required_configs = [
-            # AWS
-            AWS_REGION, 
-            
-            # SSM
-            SSM_FARGATE_COMMAND_NAME, SSM_GIT_PRIVATE_KEY_NAME, SSM_EC2_PRIVATE_KEY_NAME,
-
-            # EC2
-            EC2_USERNAME, EC2_PRIVATE_KEY, EC2_PRIVATE_KEY_PATH,
-
-            # Git
-            GIT_REPO_NAME, GIT_REPO_URL, GIT_BRANCH, SSH_KEY_STR, GIT_REPO_CONFIG,
-
-            # Terraform Cloud
-            os.environ.get('TF_TOKEN_app_terraform_io'),
-            
-            # Job
-            JOB
-        ]
-
-        for config in required_configs:
-            if not config:
-                logger.error(f"Configuration for {config} is missing!")
-                return False
+        # Check for required configurations, without fetching anything yet
+        try:
+            CONFIG.validate()
+        except ConfigError as e:
+            logger.error(str(e))
+            return False
         logger.info("All configurations are set!")
         return True
     
-    def server_handler(self, command):
+    def run_job(self, command, job_id=None, claimed=False):
+        """
+        Run a job, reporting its progress in the job store when it was recorded there.
+
+        :param claimed: The job was already marked as running by claim_next_pending().
+        """
+        if job_id is not None and not claimed:
+            CONFIG.JOB_STORE.update(job_id, JobStore.RUNNING)
+        if command != (self.bot_command or CONFIG.JOB):
+            # The bot command parameter shows what the TEC is doing
+            put_ssm_param(CONFIG.SSM_FARGATE_COMMAND_NAME, command, "String")
+        self.bot_command = command
+        CONFIG.load_job_secrets(command)
+        self.job_init_seconds = 0.0
+        self.checkpoint = JobCheckpoint(CONFIG.CHECKPOINT_BACKEND, command, job_id)
+        heartbeat_stop = threading.Event()
+        if job_id is not None:
+            # Without heartbeats the Lambda takes the job for one whose task died
+            threading.Thread(target=CONFIG.JOB_STORE.send_heartbeats, args=(job_id, CONFIG.JOB_HEARTBEAT_INTERVAL, heartbeat_stop), daemon=True).start()
+        try:
+            self.server_handler(command)
+        except (Exception, SystemExit) as e:
+            if job_id is not None:
+                CONFIG.JOB_STORE.update(job_id, JobStore.FAILED, error=str(e))
+            raise
+        finally:
+            heartbeat_stop.set()
+            logger.info(f"Job '{command}' spent {self.job_init_seconds:.2f}s in terraform init")
+        self.checkpoint.clear() # Only a failed job is resumed, another command's checkpoint is kept
+        if job_id is not None:
+            CONFIG.JOB_STORE.update(job_id, JobStore.DONE)
+
+    def drain_queue(self, idle_grace_period=None, poll_interval=None):
+        """
+        Run queued jobs in order, waiting up to idle_grace_period seconds for new ones before returning.
+        A failed job doesn't stop the queue. Returns the ids of the jobs that failed.
+        """
+        idle_grace_period = CONFIG.QUEUE_IDLE_GRACE_PERIOD if idle_grace_period is None else idle_grace_period
+        poll_interval = CONFIG.QUEUE_POLL_INTERVAL if poll_interval is None else poll_interval
+        failed = []
+        idle_since = time.monotonic()
+        while True:
+            job = CONFIG.JOB_STORE.claim_next_pending()
+            if job is None:
+                if time.monotonic() - idle_since >= idle_grace_period:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                self.run_job(job["action"], job["id"], claimed=True)
+            except (Exception, SystemExit) as e:
+                logger.error(f"Job {job['id']} ({job['action']}) failed: {e}")
+                failed.append(job["id"])
+            idle_since = time.monotonic()
+
+        logger.info(f"Command queue is empty, {len(failed)} failed jobs")
+        return failed
+
+    def prepare_workspace(self):
+        """
+        Clone tf_manifests once per task, every job in the queue runs from the same checkout.
+        """
+        if self.workspace_ready:
+            return
+        shutil.rmtree(CONFIG.GIT_REPO_CONFIG["name"], ignore_errors=True)
+
         # Initilize Git Util and Clone tf_manfiests repo
-        GIT_UTIL = GitUtil(GIT_REPO_CONFIG["paths"]["git_ssh_key"])
-        GIT_UTIL.clone(GIT_REPO_CONFIG["url"], GIT_REPO_CONFIG["name"], GIT_REPO_CONFIG["branch"])
+        GIT_UTIL = GitUtil(CONFIG.GIT_SSH_KEY_PATH)
+        repo = GIT_UTIL.clone(CONFIG.GIT_REPO_CONFIG["url"], CONFIG.GIT_REPO_CONFIG["name"], CONFIG.GIT_REPO_CONFIG["branch"],
+                       depth=CONFIG.GIT_REPO_CONFIG["depth"], sparse_paths=CONFIG.GIT_REPO_CONFIG["sparse_paths"], mirror_dir=CONFIG.GIT_REPO_CONFIG["mirror_dir"])
+        self.workspace_commit = repo.head.commit.hexsha
 
         # Copy scripts folder to tf_mc_infra folder
-        shutil.copytree(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra"], "scripts"))
+        shutil.copytree(CONFIG.GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], os.path.join(CONFIG.GIT_REPO_CONFIG["paths"]["tf_mc_infra"], "scripts"))
+        self.workspace_ready = True
 
-        # Configure Infrastructure Handler
-        TF_INFRA_HANDLER = TerraformHelper(GIT_REPO_CONFIG["paths"]["tf_mc_infra_handler"])
+    def get_terraform(self, path):
+        """
+        Return the TerraformHelper for the path, so each working directory is only initialised once.
+        """
+        if path not in self.terraform_helpers:
+            helper = TerraformHelper(path) # Built by concurrent steps, their inits take turns on the plugin cache
+            with self.terraform_lock:
+                self.terraform_helpers.setdefault(path, helper)
+                self.job_init_seconds += helper.init_seconds
+        return self.terraform_helpers[path]
+
+    def server_handler(self, command):
+        paths = CONFIG.GIT_REPO_CONFIG["paths"]
 
-        # Get Infrastructure Handler Outputs
-        API_URL = TF_INFRA_HANDLER.run_command("output", "api_gateway_url")
-        MACHINE_IP = TF_INFRA_HANDLER.run_command("output", "eip")
-        S3_URI = TF_INFRA_HANDLER.run_command("output", "mc_s3_bucket_uri")
-        MC_PORT = TF_INFRA_HANDLER.run_command("output", "mc_port")
+        # Steps shared by every command: clone, configure the Infrastructure Handler and read its outputs
+        graph = StepGraph(command, checkpoint=self.checkpoint)
+        graph.add("workspace", lambda results: self.prepare_workspace())
+        graph.add("tf_infra_handler_init", lambda results: self.get_terraform(paths["tf_mc_infra_handler"]), depends_on=["workspace"])
+        graph.add("outputs", lambda results: results["tf_infra_handler_init"].get_outputs(), depends_on=["tf_infra_handler_init"])
+
+        # Get Infrastructure Handler Outputs, read together by the outputs step and cached for the jobs that follow.
+        # A missing output raises a TerraformError naming it
+        API_URL = lambda results: results["tf_infra_handler_init"].get_output("api_gateway_url")
+        MACHINE_IP = lambda results: results["tf_infra_handler_init"].get_output("eip")
+        S3_URI = lambda results: results["tf_infra_handler_init"].get_output("mc_s3_bucket_uri")
+        MC_PORT = lambda results: str(results["tf_infra_handler_init"].get_output("mc_port")) # Passed to the scripts as an argument
         
         if command == "start":       
             # Install Script Paths
-            local_install_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "ec2_install.sh")
+            local_install_script_path = os.path.join(paths["tf_mc_infra_scripts"], "ec2_install.sh")
             remote_install_script_path = "setup/scripts/ec2_install.sh"
             remote_install_logs_path = "setup/logs/install.log"
 
             # Prepare Env Script Paths
-            local_prepare_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "prepare_ec2_env.sh")
+            local_prepare_script_path = os.path.join(paths["tf_mc_infra_scripts"], "prepare_ec2_env.sh")
             remote_prepare_script_path = "setup/scripts/prepare_ec2_env.sh"
             remote_prepare_logs_path = "setup/logs/prepare.log"
 
-            rcon_pass = None
-
             # Helper Function Script paths
-            local_helper_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "helper_functions.sh")
+            local_helper_script_path = os.path.join(paths["tf_mc_infra_scripts"], "helper_functions.sh")
             remote_helper_script_path = "setup/scripts/helper_functions.sh"
 
-            # Configure Minecraft Infrastructure
-            TF_MINECRAFT_INFRA = TerraformHelper(GIT_REPO_CONFIG["paths"]["tf_mc_infra"])
-            TF_MINECRAFT_INFRA.run_command("apply")
+            def upload_scripts(results):
+                # Copy Scripts to EC2 Instance, creating the Logs and scripts folder on the way
+                results["ssh_connect"].upload_files({
+                    local_helper_script_path: remote_helper_script_path,
+                    local_install_script_path: remote_install_script_path,
+                    local_prepare_script_path: remote_prepare_script_path
+                }, directories=["setup/logs"])
+
+            def install(results):
+                results["ssh_connect"].run_script(remote_install_script_path, remote_install_logs_path, timeout=CONFIG.REMOTE_SCRIPT_TIMEOUT)
+                results["ssh_connect"].run_command(f"mkdir -p {INSTANCE_MARKERS_DIR} && touch {INSTANCE_MARKERS_DIR}/install", False)
 
-            # Initilize SSH Util
-            SSH_UTIL = SSHUtil(MACHINE_IP, EC2_USERNAME, EC2_PRIVATE_KEY_PATH)
+            def prepare(results):
+                results["ssh_connect"].run_script(remote_prepare_script_path, remote_prepare_logs_path, S3_URI(results), CONFIG.SSM_GIT_PRIVATE_KEY_NAME, CONFIG.AWS_REGION, API_URL(results), MC_PORT(results), CONFIG.SERVER_ID, CONFIG.AUTH_TOKEN_NAME or "", timeout=CONFIG.REMOTE_SCRIPT_TIMEOUT)
+                results["ssh_connect"].run_command(f"mkdir -p {INSTANCE_MARKERS_DIR} && touch {INSTANCE_MARKERS_DIR}/prepare", False)
 
-            # Create Logs and scripts folder
-            SSH_UTIL.run_command("mkdir -p setup/logs setup/scripts", False)
+            def ssh_connect(results):
+                SSH_UTIL = SSHUtil(MACHINE_IP(results), CONFIG.EC2_USERNAME, CONFIG.EC2_PRIVATE_KEY_PATH, ready_timeout=CONFIG.SSH_READY_TIMEOUT, cancel=graph.cancelled)
+                put_metric("SSHReadySeconds", SSH_UTIL.ready_seconds, "Seconds", {"Command": command}, CONFIG.METRICS_NAMESPACE)
+                return SSH_UTIL
 
-            # Copy Scripts to EC2 Instance
-            SSH_UTIL.scp_to_machine(local_helper_script_path, remote_helper_script_path)
-            SSH_UTIL.scp_to_machine(local_install_script_path, remote_install_script_path)
-            SSH_UTIL.scp_to_machine(local_prepare_script_path, remote_prepare_script_path)
+            # Resuming a failed start: apply is skipped when the plan has no changes, and the scripts when
+            # their marker is still on the instance (a new instance has none)
+            manifests = lambda results: { "commit": self.workspace_commit }
+            script_inputs = lambda results: { "commit": self.workspace_commit, "outputs": results["outputs"] }
 
-            # Run Scripts in EC2 Instance
-            SSH_UTIL.run_script(remote_install_script_path, remote_install_logs_path)
-            SSH_UTIL.run_script(remote_prepare_script_path, remote_prepare_logs_path, S3_URI, SSM_GIT_PRIVATE_KEY_NAME, AWS_REGION, API_URL, MC_PORT)
+            # Configure Minecraft Infrastructure alongside the Infrastructure Handler. The EIP is known
+            # before apply, so the SSH connection is retried while the instance is created.
+            graph.add("tf_mc_infra_init", lambda results: self.get_terraform(paths["tf_mc_infra"]), depends_on=["workspace"])
+            graph.add("apply", lambda results: results["tf_mc_infra_init"].run_command("apply"), depends_on=["tf_mc_infra_init"],
+                      inputs=manifests, verify=lambda results: not results["tf_mc_infra_init"].has_changes())
+            graph.add("ssh_connect", ssh_connect, depends_on=["outputs"]) # Waits for the instance while apply runs, until apply fails
+            graph.add("upload_scripts", upload_scripts, depends_on=["apply", "ssh_connect"])
+            graph.add("install", install, depends_on=["upload_scripts"],
+                      inputs=script_inputs, verify=lambda results: results["ssh_connect"].file_exists(f"{INSTANCE_MARKERS_DIR}/install"))
+            graph.add("prepare", prepare, depends_on=["install"],
+                      inputs=script_inputs, verify=lambda results: results["ssh_connect"].file_exists(f"{INSTANCE_MARKERS_DIR}/prepare"))
+            graph.run()
 
         elif command == "stop":
             # Server Shutdown Script Paths
-            local_shutdown_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "post_mc_server_shutdown.sh")
+            local_shutdown_script_path = os.path.join(paths["tf_mc_infra_scripts"], "post_mc_server_shutdown.sh")
             remote_shutdown_script_path = "setup/scripts/post_mc_server_shutdown.sh"
             remote_shutdown_logs_path = "setup/logs/shutdown.log"
 
             # Helper Function Script paths
-            local_helper_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "helper_functions.sh")
+            local_helper_script_path = os.path.join(paths["tf_mc_infra_scripts"], "helper_functions.sh")
             remote_helper_script_path = "setup/scripts/helper_functions.sh"
 
-            # Initilize SSH Util
-            SSH_UTIL = SSHUtil(MACHINE_IP, EC2_USERNAME, EC2_PRIVATE_KEY_PATH)
-
-            # Copy Scripts to EC2 Instance
-            SSH_UTIL.scp_to_machine(local_helper_script_path, remote_helper_script_path)
-            SSH_UTIL.scp_to_machine(local_shutdown_script_path, remote_shutdown_script_path)
-
-            # Run Scripts in EC2 Instance
-            SSH_UTIL.run_script(remote_shutdown_script_path, remote_shutdown_logs_path, S3_URI)
-
             # Check minecraft-world.bundle size - need to add an option for output in ssh_andrun_command.
             mincraft_bundle_path = os.path.join("minecraft-AWS-server", "docker", "minecraft-data", "minecraft-world.bundle")
-            mc_world_size = SSH_UTIL.run_command(f"stat -c%s {mincraft_bundle_path}", True)
 
-            # Terraform commands
-            TF_MINECRAFT_INFRA = TerraformHelper(GIT_REPO_CONFIG["paths"]["tf_mc_infra"])
-            TF_MINECRAFT_INFRA.run_command("destroy")
+            def upload_scripts(results):
+                # Copy Scripts to EC2 Instance
+                results["ssh_connect"].upload_files({
+                    local_helper_script_path: remote_helper_script_path,
+                    local_shutdown_script_path: remote_shutdown_script_path
+                }, directories=["setup/logs"])
+
+            # The Minecraft Infrastructure is initialised while the world is backed up and destroyed afterwards
+            graph.add("tf_mc_infra_init", lambda results: self.get_terraform(paths["tf_mc_infra"]), depends_on=["workspace"])
+            graph.add("ssh_connect", lambda results: SSHUtil(MACHINE_IP(results), CONFIG.EC2_USERNAME, CONFIG.EC2_PRIVATE_KEY_PATH, cancel=graph.cancelled), depends_on=["outputs"])
+            graph.add("upload_scripts", upload_scripts, depends_on=["ssh_connect"])
+            graph.add("shutdown", lambda results: results["ssh_connect"].run_script(remote_shutdown_script_path, remote_shutdown_logs_path, S3_URI(results), timeout=CONFIG.REMOTE_SCRIPT_TIMEOUT), depends_on=["upload_scripts"])
+            graph.add("mc_world_size", lambda results: int(results["ssh_connect"].run_command(f"stat -c%s {mincraft_bundle_path}", True)), depends_on=["shutdown"])
+            graph.add("destroy", lambda results: results["tf_mc_infra_init"].run_command("destroy"), depends_on=["tf_mc_infra_init", "mc_world_size"])
 
             # If the minecraft bundle is over a certain size -> start new job to compress it
-            check_mc_bundle_size(int(mc_world_size), API_URL)
+            graph.add("check_mc_bundle_size", lambda results: check_mc_bundle_size(results["mc_world_size"], API_URL(results), CONFIG.API_TOKEN, CONFIG.SERVER_ID), depends_on=["destroy"])
+            graph.run()
         elif command == "mc_world_archive":
             # Archive Minecraft World Data Script
-            local_archive_mc_script_path = os.path.join(GIT_REPO_CONFIG["paths"]["tf_mc_infra_scripts"], "mc_world_archiver.sh")
-            run_script(local_archive_mc_script_path, S3_URI)
+            local_archive_mc_script_path = os.path.join(paths["tf_mc_infra_scripts"], "mc_world_archiver.sh")
+            graph.add("archive", lambda results: run_script(local_archive_mc_script_path, S3_URI(results), timeout=CONFIG.LOCAL_SCRIPT_TIMEOUT, idle_timeout=CONFIG.LOCAL_SCRIPT_IDLE_TIMEOUT), depends_on=["outputs"])
+            graph.run()
         else:
-            logger.error("error command not found")
-        
+            # Recorded as a failed job instead of a completed one
+            raise ValueError(f"Unknown command: '{command}'")
+
         logger.info("Server Handler Completed Successfully")
 
 if __name__ == "__main__":
     manager = ServerManager()
-    manager.server_handler(JOB)
\ No newline at end of file
+    if not manager.configured:
+        sys.exit(1)
+    failed = []
+    try:
+        try:
+            manager.run_job(CONFIG.JOB, CONFIG.JOB_ID)
+        except (Exception, SystemExit) as e:
+            logger.error(f"Job '{CONFIG.JOB}' failed: {e}")
+            failed.append(CONFIG.JOB_ID)
+        failed += manager.drain_queue()
+    finally:
+        # A command queued after the last poll is left pending, the next command or status call launches a TEC for it
+        release_launch_lock(CONFIG.SSM_FARGATE_COMMAND_NAME, CONFIG.LAUNCH_LOCK_OWNER)
+    sys.exit(1 if failed else 0)
\ No newline at end of file
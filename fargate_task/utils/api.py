@@ -1,12 +1,30 @@
+import json
 import requests
 from utils.logger import setup_logging
 
 # Setting up logging
 logger = setup_logging()
 
-def send_to_api(data, url):
+def load_api_token(param_name):
     """
-    Send Data to API Gateway
+    The bearer token for the API: the first token of the keyring the Lambda checks requests against,
+    a JSON list or comma/newline separated tokens in an SSM parameter.
+    """
+    from utils.aws import get_ssm_param
+    value = get_ssm_param(param_name)
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        parsed = None
+    tokens = parsed if isinstance(parsed, list) else value.replace("\n", ",").split(",")
+    tokens = [token.strip() for token in tokens if isinstance(token, str) and token.strip()]
+    if not tokens:
+        raise ValueError(f"No API token in '{param_name}'")
+    return tokens[0]
+
+def send_to_api(data, url, token=None):
+    """
+    Send Data to API Gateway, with the bearer token when the API is authorized
     """
     if url is None:
         print("API_URL is not set in the environment variables")
@@ -15,6 +33,8 @@ def send_to_api(data, url):
     url += "/command"
     
     headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
     
     logger.info(f"Sending Data to API: {data}")
     
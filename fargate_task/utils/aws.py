@@ -1,37 +1,186 @@
 import os
+import time
+import threading
 import boto3
+from botocore.config import Config
+from collections import Counter
 from .logger import setup_logging
 
 # Setting up logging
 logger = setup_logging()
 
-def get_ssm_param(param_name):
+_clients = {} # service name -> boto3 client, shared by every thread of the task
+_clients_lock = threading.Lock() # Creating clients from the default session isn't thread-safe
+
+def get_client(service):
+    """
+    Return the task's client for an AWS service, created once in the default region.
+    """
+    with _clients_lock:
+        if service not in _clients:
+            # Throttled calls, e.g. bursts of SSM writes by the job queue and locks, are retried with backoff
+            _clients[service] = boto3.client(service, config=Config(retries={"mode": "adaptive", "max_attempts": 5}))
+        return _clients[service]
+
+class ParameterNotFoundError(ValueError):
+    """
+    Raised when SSM Parameter Store has no parameter with the requested name.
+    """
+    def __init__(self, names):
+        super().__init__(f"SSM parameters not found: {', '.join(names)}")
+        self.names = names
+
+class ParameterStore:
+    """
+    Reads SSM parameters with batched GetParameters calls and caches the decrypted values in memory.
+    Cached values expire after `ttl` seconds and writes through put() invalidate them.
+
+    Shared by the step threads and the heartbeat thread: the lock guards the cache, the counters and the
+    creation of the one SSM client, never an SSM call.
+    """
+    MAX_NAMES_PER_CALL = 10 # GetParameters accepts at most 10 names per call
+
+    def __init__(self, client=None, ttl=300):
+        self.client = client
+        self.ttl = ttl
+        self.cache = {} # name -> {"value", "version", "expires_at"}
+        self.calls = Counter() # Number of SSM calls made, by operation
+        self.lock = threading.Lock()
+
+    def _get_client(self):
+        with self.lock:
+            if self.client is None:
+                self.client = get_client('ssm')
+            return self.client
+
+    def get_many(self, names, max_age=None):
+        """
+        Return {name: value} for the named parameters, fetching the ones that aren't cached in as few calls as possible.
+        """
+        names = list(dict.fromkeys(names))
+        now = time.monotonic()
+        values = {}
+        to_fetch = []
+        with self.lock:
+            for name in names:
+                entry = self.cache.get(name)
+                if entry is not None and (entry["expires_at"] > now if max_age is None else now - entry["fetched_at"] < max_age):
+                    values[name] = entry["value"]
+                else:
+                    to_fetch.append(name)
+
+        missing = []
+        for i in range(0, len(to_fetch), self.MAX_NAMES_PER_CALL):
+            response = self._get_client().get_parameters(Names=to_fetch[i:i + self.MAX_NAMES_PER_CALL], WithDecryption=True)
+            with self.lock:
+                self.calls["get_parameters"] += 1
+                missing.extend(response.get("InvalidParameters", []))
+                for parameter in response.get("Parameters", []):
+                    previous = self.cache.get(parameter["Name"])
+                    if previous is not None and previous["version"] != parameter["Version"]:
+                        logger.info(f"SSM parameter '{parameter['Name']}' changed: version {previous['version']} -> {parameter['Version']}")
+                    self.cache[parameter["Name"]] = { "value": parameter["Value"], "version": parameter["Version"], "fetched_at": time.monotonic(), "expires_at": time.monotonic() + self.ttl }
+                    values[parameter["Name"]] = parameter["Value"]
+
+        if to_fetch:
+            logger.info(f"SSM: fetched {len(to_fetch)} parameters, {len(names) - len(to_fetch)} served from cache (total calls: {dict(self.calls)})")
+        if missing:
+            raise ParameterNotFoundError(missing)
+        return values
+
+    def get_versioned(self, name):
+        """
+        Read a parameter from SSM, bypassing the cache, and return (value, version).
+        """
+        response = self._get_client().get_parameters(Names=[name], WithDecryption=True)
+        with self.lock:
+            self.calls["get_parameters"] += 1
+        if not response.get("Parameters"):
+            raise ParameterNotFoundError([name])
+        parameter = response["Parameters"][0]
+        return parameter["Value"], parameter["Version"]
+
+    def put(self, name, value, param_type="SecureString", overwrite=True):
+        """
+        Write a parameter and invalidate its cached value. Returns the new version.
+        """
+        try:
+            response = self._get_client().put_parameter(Name=name, Value=value, Type=param_type, Overwrite=overwrite)
+        finally:
+            with self.lock:
+                self.calls["put_parameter"] += 1
+            self.invalidate(name)
+        return response.get("Version", 0)
+
+    def delete(self, name):
+        """
+        Delete a parameter and invalidate its cached value. Returns False if it didn't exist.
+        """
+        client = self._get_client()
+        try:
+            client.delete_parameter(Name=name)
+            return True
+        except client.exceptions.ParameterNotFound:
+            return False
+        finally:
+            with self.lock:
+                self.calls["delete_parameter"] += 1
+            self.invalidate(name)
+
+    def invalidate(self, *names):
+        with self.lock:
+            for name in names:
+                self.cache.pop(name, None)
+
+# Shared by everything in the task, so each parameter is fetched once per container
+PARAMETER_STORE = ParameterStore()
+
+def get_ssm_params(param_names, max_age=None):
+    """
+    Fetch several parameter values from AWS Systems Manager (SSM) Parameter Store in batched calls.
+    """
+    return PARAMETER_STORE.get_many(param_names, max_age)
+
+def get_ssm_param(param_name, max_age=None):
     """
     Fetch the parameter value from AWS Systems Manager (SSM) Parameter Store.
     """
-    ssm_client = boto3.client('ssm')
-    response = ssm_client.get_parameter(
-        Name=param_name ,
-        WithDecryption=True
-    )
-    return response['Parameter']['Value']
+    return get_ssm_params([param_name], max_age)[param_name]
 
-def put_ssm_param(param_name, param_value, param_type="SecureString"):
+def get_ssm_param_version(param_name):
+    """
+    Fetch the parameter value and its version from AWS Systems Manager (SSM) Parameter Store, bypassing the cache.
+    """
+    return PARAMETER_STORE.get_versioned(param_name)
+
+def put_ssm_param(param_name, param_value, param_type="SecureString", overwrite=True):
     """
     Put the specified parameter value into AWS Systems Manager (SSM) Parameter Store.
     """
-    ssm_client = boto3.client('ssm', region_name='eu-west-2')
+    return PARAMETER_STORE.put(param_name, param_value, param_type, overwrite)
 
-    ssm_client.put_parameter(
-        Name=param_name,
-        Value=param_value,
-        Type=param_type,
-        Overwrite=True
-    )
+def delete_ssm_param(param_name):
+    """
+    Delete the parameter from AWS Systems Manager (SSM) Parameter Store.
+    """
+    return PARAMETER_STORE.delete(param_name)
 
+def put_metric(name, value, unit="Seconds", dimensions=None, namespace="MinecraftServer/TEC"):
+    """
+    Publish a CloudWatch metric. A failure is only logged, metrics never fail a job.
+    """
+    try:
+        get_client('cloudwatch').put_metric_data(Namespace=namespace, MetricData=[{
+            "MetricName": name,
+            "Value": value,
+            "Unit": unit,
+            "Dimensions": [{"Name": key, "Value": str(dimension)} for key, dimension in (dimensions or {}).items()]
+        }])
+    except Exception as e:
+        logger.warning(f"Unable to publish metric {name}: {e}")
 
 def get_region():
     """
     Fetch the current region from boto3
     """
-    return boto3.session.Session().region_name
\ No newline at end of file
+    return boto3.session.Session().region_name
@@ -0,0 +1,113 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+from .aws import get_ssm_param, put_ssm_param, delete_ssm_param, ParameterNotFoundError
+from .logger import setup_logging
+
+# Setting up logging
+logger = setup_logging()
+
+CHECKPOINT_PARAM_SUFFIX = "_CHECKPOINT" # The checkpoint lives next to the bot command parameter
+
+class SSMCheckpointBackend:
+    """
+    Keeps the checkpoint document in an SSM parameter, so it survives the task.
+    """
+    def __init__(self, bot_command_name):
+        self.param_name = bot_command_name + CHECKPOINT_PARAM_SUFFIX
+
+    def load(self):
+        try:
+            return json.loads(get_ssm_param(self.param_name, max_age=0))
+        except ParameterNotFoundError:
+            return None
+
+    def save(self, document):
+        put_ssm_param(self.param_name, json.dumps(document, separators=(",", ":")), "String")
+
+    def delete(self):
+        delete_ssm_param(self.param_name)
+
+class LocalCheckpointBackend:
+    """
+    Keeps the checkpoint document in a local JSON file, a stand-in for SSM when running outside AWS.
+    """
+    def __init__(self, bot_command_name, directory):
+        self.path = os.path.join(directory, bot_command_name.replace("/", "_") + CHECKPOINT_PARAM_SUFFIX + ".json")
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, document):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(document, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def get_checkpoint_backend(bot_command_name, backend="ssm", directory=None):
+    if backend == "ssm":
+        return SSMCheckpointBackend(bot_command_name)
+    if backend == "local":
+        return LocalCheckpointBackend(bot_command_name, directory)
+    raise ValueError(f"Unsupported checkpoint backend: {backend}. Supported values are 'ssm' and 'local'.")
+
+def fingerprint(value):
+    """
+    Short, stable hash of a JSON-serialisable value.
+    """
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class JobCheckpoint:
+    """
+    The steps a command has completed, with the fingerprints of their inputs and outputs.
+
+    A task that dies mid-job leaves its checkpoint behind, and the next run of the same command
+    skips the steps whose inputs are unchanged. A checkpoint left by another command is ignored and kept,
+    and a job that succeeds clears the checkpoint it resumed from or saved.
+    """
+    def __init__(self, backend, command, job_id=None):
+        self.backend = backend
+        self.command = command
+        self.lock = threading.Lock() # Steps complete on several threads
+
+        document = backend.load()
+        if document and document.get("command") == command:
+            logger.info(f"Resuming '{command}' from the checkpoint of job {document.get('job_id')}: {', '.join(document['steps']) or 'no steps'} completed")
+            self.document = { **document, "job_id": job_id }
+        else:
+            self.document = { "command": command, "job_id": job_id, "steps": {} }
+
+    def get(self, step):
+        return self.document["steps"].get(step)
+
+    def save(self, step, inputs, outputs):
+        with self.lock:
+            self.document["steps"][step] = {
+                "inputs": inputs,
+                "outputs": outputs,
+                "at": datetime.datetime.utcnow().isoformat(timespec="seconds")
+            }
+            self.backend.save(self.document)
+
+    def clear(self):
+        """
+        Delete the stored checkpoint if it is this command's, leaving another command's checkpoint to be resumed.
+        """
+        with self.lock:
+            if not self.document["steps"]:
+                return False # Nothing saved or resumed by this job, the stored checkpoint isn't its own
+            self.document["steps"] = {}
+            self.backend.delete()
+            return True
@@ -45,7 +45,7 @@ def write_to_tmp_file(content):
         dir = temp_file.name
     return dir
 
-def check_mc_bundle_size(file_size, api_url):
+def check_mc_bundle_size(file_size, api_url, api_token=None, server_id="default"):
     try:
         MAX_BUNDLE_SIZE_MB = 1600
         BUFFER = 0.15 
@@ -54,8 +54,8 @@ def check_mc_bundle_size(file_size, api_url):
         logger.info(f"Minecraft Bundle size: {convert_bytes(file_size)['size_gb']} GB")
 
         if convert_bytes(file_size)["size_mb"] > BUNDLE_SIZE_LIMIT:
-            data = {"action": "mc_world_archive"}
-            response = send_to_api(data, api_url)
+            data = {"action": "mc_world_archive", "server_id": server_id}
+            response = send_to_api(data, api_url, api_token)
             return response
         else:
             logger.info(f"Minecraft Bundle size within permissible limit.")
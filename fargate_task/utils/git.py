@@ -1,5 +1,7 @@
 import os
+import shutil
 import subprocess
+import time
 from git import Repo
 from .logger import setup_logging
 
@@ -12,21 +14,75 @@ class GitUtil:
         self.git_ssh_command = f"ssh -i {ssh_key_path} -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
         os.environ['GIT_SSH_COMMAND'] = self.git_ssh_command
 
-    def clone(self, repo_url, target_directory, branch='main'):
+    def clone(self, repo_url, target_directory, branch='main', depth=None, sparse_paths=None, mirror_dir=None):
         """
         Clone a Git repository.
 
+        Only `branch` is fetched, blobs are downloaded for the files that are checked out and
+        `depth` limits the history, so the clone doesn't grow with the repository's history.
+
         :param repo_url: URL of the git repository.
         :param target_directory: Directory where the repo should be cloned.
         :param branch: The branch to clone. Default is 'main'.
-        :return: None
+        :param depth: Number of commits to fetch, the whole history when None.
+        :param sparse_paths: Directories to check out, relative to the repo's root. Everything when None.
+        :param mirror_dir: Reusable clone kept between runs. It is fetched incrementally and its
+                           files are copied to target_directory.
+        :return: The cloned git.Repo, the mirror's when mirror_dir is set.
         """
+        start = time.monotonic()
         try:
-            repo = Repo.clone_from(url=repo_url, to_path=target_directory, branch=branch)
+            if mirror_dir:
+                repo, fetched_bytes = self._update_mirror(repo_url, mirror_dir, branch, depth, sparse_paths)
+                shutil.copytree(mirror_dir, target_directory, ignore=shutil.ignore_patterns(".git"))
+            else:
+                repo, fetched_bytes = self._clone(repo_url, target_directory, branch, depth, sparse_paths)
         except Exception as e:
             raise Exception(f"Git clone failed:\n{str(e)}")
-        
+
+        logger.info(f"Cloned '{branch}' of {repo_url} into '{target_directory}' in {time.monotonic() - start:.2f}s, {fetched_bytes / 1024:.1f} KiB fetched")
         return repo
+
+    def _clone(self, repo_url, directory, branch, depth, sparse_paths):
+        """
+        Single-branch, blobless clone checking out only sparse_paths. Returns (repo, bytes fetched).
+        """
+        repo = Repo.clone_from(url=repo_url, to_path=directory, branch=branch, single_branch=True,
+                               depth=depth, filter="blob:none", no_checkout=bool(sparse_paths))
+        if sparse_paths:
+            repo.git.sparse_checkout("set", *sparse_paths)
+            repo.git.checkout(branch)
+        return repo, self._objects_size(repo)
+
+    def _update_mirror(self, repo_url, mirror_dir, branch, depth, sparse_paths):
+        """
+        Bring the mirror up to date with the branch, cloning it on first use or when it can't be updated.
+        Returns (repo, bytes fetched).
+        """
+        if os.path.isdir(os.path.join(mirror_dir, ".git")):
+            try:
+                repo = Repo(mirror_dir)
+                size_before = self._objects_size(repo)
+                repo.remote("origin").set_url(repo_url)
+                repo.git.fetch("origin", branch, depth=depth, filter="blob:none", prune=True)
+                if sparse_paths:
+                    repo.git.sparse_checkout("set", *sparse_paths)
+                repo.git.reset("--hard", "FETCH_HEAD")
+                repo.git.clean("-ffdx")
+                logger.info(f"Updated git mirror '{mirror_dir}' to {repo.head.commit.hexsha[:12]}")
+                return repo, max(self._objects_size(repo) - size_before, 0)
+            except Exception as e:
+                logger.warning(f"Git mirror '{mirror_dir}' can't be updated, cloning it again: {e}")
+
+        shutil.rmtree(mirror_dir, ignore_errors=True)
+        return self._clone(repo_url, mirror_dir, branch, depth, sparse_paths)
+
+    def _objects_size(self, repo):
+        """
+        Bytes in the repo's object store, its growth is what was fetched.
+        """
+        objects_dir = os.path.join(repo.git_dir, "objects")
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(objects_dir) for name in names)
     
     # Should use git python
     # def checkout(self, directory, branch):
@@ -45,15 +101,16 @@ class GitUtil:
     #         raise
         
     @staticmethod
-    def get_git_branch() -> str:
+    def get_git_branch(current_env=None) -> str:
         """
         Get the Environment's Git Branch
 
+        :param current_env: The environment, the ENVIRONMENT variable by default.
         :return: Name of the Environment's branch.
         """
         dev_env = "DEV"
         prod_env = "PROD"
-        current_env = os.environ.get('ENVIRONMENT')
+        current_env = current_env or os.environ.get('ENVIRONMENT')
 
         if current_env is None:
             raise ValueError("ENVIRONMENT variable is not set.")
@@ -0,0 +1,107 @@
+import json
+import random
+import time
+import uuid
+from botocore.exceptions import ClientError
+from .aws import get_ssm_param_version, put_ssm_param, delete_ssm_param, ParameterNotFoundError
+from .logger import setup_logging
+
+# Setting up logging
+logger = setup_logging()
+
+LAUNCH_LOCK_PARAM_SUFFIX = "_LAUNCH_LOCK" # The lock lives next to the bot command parameter
+CLOCK_SKEW_MARGIN = 5 # Seconds a lock is considered ours before its expiry, so a late write can't land after it is broken
+
+def release_launch_lock(bot_command_name, owner):
+    """
+    Delete the launch lock the Lambda took to start this task, so the next command can launch a new TEC.
+    The lock is left alone if it was taken over by someone else. Like the Lambda, the owner is checked
+    again right before the delete while holding the lock's ParameterMutex, as SSM has no conditional delete.
+    """
+    if not owner:
+        return False
+
+    param_name = bot_command_name + LAUNCH_LOCK_PARAM_SUFFIX
+    with ParameterMutex(param_name):
+        try:
+            lock = json.loads(get_ssm_param_version(param_name)[0])
+        except ParameterNotFoundError:
+            return False
+
+        if lock.get("owner") != owner:
+            logger.warning(f"Launch lock '{param_name}' is owned by another launch, leaving it in place")
+            return False
+
+        logger.info(f"Releasing launch lock '{param_name}'")
+        return delete_ssm_param(param_name)
+
+class ParameterMutex:
+    """
+    Short-lived mutual exclusion for read-modify-write updates of an SSM parameter, shared with the Lambda.
+    Taken by creating "<param_name>_MUTEX" with Overwrite=False, waiting with jittered exponential backoff.
+    An expired mutex is broken, and a late holder releases it, the same way as the Lambda does: holding the
+    mutex's own ParameterMutex (unguarded) and checking it is unchanged right before the delete.
+    """
+    def __init__(self, param_name, ttl=30, timeout=10, guarded=True):
+        self.param_name = param_name + "_MUTEX"
+        self.ttl = ttl
+        self.timeout = timeout
+        self.guarded = guarded
+        self.owner = None
+        self.expires_at = None
+
+    def __enter__(self):
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        delay = 0.05
+        while True:
+            expires_at = time.time() + self.ttl
+            try:
+                put_ssm_param(self.param_name, json.dumps({ "owner": owner, "expires_at": expires_at }), "String", overwrite=False)
+                self.owner, self.expires_at = owner, expires_at
+                return self
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ParameterAlreadyExists":
+                    raise
+
+            holder, version = self._read()
+            if holder is not None and holder["expires_at"] < time.time():
+                self._delete_if_unchanged(lambda current, current_version: current_version == version, f"Removing expired mutex '{self.param_name}'")
+                continue
+
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for '{self.param_name}'")
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, 1)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if time.time() < self.expires_at - CLOCK_SKEW_MARGIN:
+            # Nobody breaks a mutex before it expires, it is still ours
+            delete_ssm_param(self.param_name)
+        else:
+            owner = self.owner
+            self._delete_if_unchanged(lambda current, _: current["owner"] == owner, f"Releasing mutex '{self.param_name}' after its expiry")
+        self.owner = self.expires_at = None
+        return False
+
+    def _delete_if_unchanged(self, check, message):
+        """
+        Delete the mutex if check(current mutex, its version) still holds right before the delete.
+        """
+        if not self.guarded:
+            current, version = self._read()
+            if current is not None and check(current, version):
+                delete_ssm_param(self.param_name)
+            return
+        with ParameterMutex(self.param_name, ttl=10, timeout=self.timeout, guarded=False):
+            current, version = self._read()
+            if current is not None and check(current, version):
+                logger.warning(message)
+                delete_ssm_param(self.param_name)
+
+    def _read(self):
+        try:
+            value, version = get_ssm_param_version(self.param_name)
+        except ParameterNotFoundError:
+            return None, None
+        return json.loads(value), version
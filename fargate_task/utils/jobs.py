@@ -0,0 +1,108 @@
+import json
+import datetime
+from .aws import get_ssm_param, put_ssm_param, ParameterNotFoundError
+from .guard import ParameterMutex
+from .logger import setup_logging
+
+# Setting up logging
+logger = setup_logging()
+
+JOBS_PARAM_SUFFIX = "_JOBS" # The job store lives next to the bot command parameter
+
+class JobStore:
+    """
+    FIFO queue of TEC commands recorded by the Lambda in an SSM parameter (a JSON document).
+    The task claims pending jobs in order and reports their progress. Writes hold the same
+    ParameterMutex as the Lambda so a claim can't overwrite a concurrently queued job.
+
+    While a job runs the task sends heartbeats, the Lambda fails running jobs whose heartbeat stopped.
+    """
+    PENDING = "PENDING"
+    DISPATCHED = "DISPATCHED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    MAX_FINISHED_JOBS = 10 # Finished jobs kept for status queries
+    MAX_DOCUMENT_BYTES = 4000 # A standard parameter value is limited to 4096 bytes, kept with a margin
+    MAX_ERROR_LENGTH = 200 # Longer job errors are truncated so a few of them can't fill the document
+
+    def __init__(self, bot_command_name):
+        self.param_name = bot_command_name + JOBS_PARAM_SUFFIX
+
+    def claim_next_pending(self):
+        """
+        Mark the oldest pending job as running and return it, or None when nothing is pending.
+        """
+        with ParameterMutex(self.param_name):
+            document = self._load()
+            for job in document["jobs"]:
+                if job["state"] == self.PENDING:
+                    self._set_state(job, self.RUNNING)
+                    self._save(document)
+                    logger.info(f"Claimed pending job {job['id']} ({job['action']})")
+                    return job
+        return None
+
+    def update(self, job_id, state, **fields):
+        with ParameterMutex(self.param_name):
+            document = self._load()
+            for job in document["jobs"]:
+                if job["id"] == job_id:
+                    self._set_state(job, state, **fields)
+                    self._save(document)
+                    logger.info(f"Job {job_id} is now {state}")
+                    return job
+        logger.warning(f"Job {job_id} not found in '{self.param_name}'")
+        return None
+
+    def heartbeat(self, job_id):
+        """
+        Record that the task is still working on a running job.
+        """
+        with ParameterMutex(self.param_name):
+            document = self._load()
+            for job in document["jobs"]:
+                if job["id"] == job_id and job["state"] == self.RUNNING:
+                    job["heartbeat_at"] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+                    self._save(document)
+                    return True
+        return False
+
+    def send_heartbeats(self, job_id, interval, stop):
+        """
+        Send a heartbeat for the job every `interval` seconds until the `stop` event is set.
+        """
+        while not stop.wait(interval):
+            try:
+                if not self.heartbeat(job_id):
+                    logger.warning(f"Job {job_id} is no longer running in '{self.param_name}', stopping its heartbeat")
+                    return
+            except Exception as e:
+                logger.warning(f"Heartbeat of job {job_id} failed: {e}")
+
+    def _set_state(self, job, state, **fields):
+        job.update(state=state, updated_at=datetime.datetime.utcnow().isoformat(timespec="seconds"), **fields)
+
+    def _load(self):
+        try:
+            return json.loads(get_ssm_param(self.param_name, max_age=0))
+        except ParameterNotFoundError:
+            return { "next_id": 1, "jobs": [] }
+
+    def _save(self, document):
+        """
+        Write the document, truncating long errors and dropping the oldest finished jobs beyond
+        MAX_FINISHED_JOBS or for as long as the document is over MAX_DOCUMENT_BYTES.
+        """
+        for job in document["jobs"]:
+            if len(job.get("error") or "") > self.MAX_ERROR_LENGTH:
+                job["error"] = job["error"][:self.MAX_ERROR_LENGTH - 3] + "..."
+        finished = [job for job in document["jobs"] if job["state"] in (self.DONE, self.FAILED)]
+        for job in finished[:-self.MAX_FINISHED_JOBS]:
+            document["jobs"].remove(job)
+            finished.remove(job)
+        value = json.dumps(document, separators=(",", ":"))
+        while len(value.encode()) > self.MAX_DOCUMENT_BYTES and finished:
+            document["jobs"].remove(finished.pop(0))
+            value = json.dumps(document, separators=(",", ":"))
+        put_ssm_param(self.param_name, value, "String")
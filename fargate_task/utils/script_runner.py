@@ -1,44 +1,112 @@
 import os
+import selectors
+import signal
 import stat
 import subprocess
-import sys
+import time
+from collections import deque
 from .logger import setup_logging
 
 # Setting up logging
 logger = setup_logging()
 
-def run_script(script_path: str, *script_args: str) -> None:
+class ScriptError(Exception):
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+def run_script(script_path: str, *script_args: str, timeout: float = None, idle_timeout: float = None, check: bool = True, tail_lines: int = 200) -> dict:
+    """
+    Run a local script, logging its stdout and stderr line by line as they arrive.
+
+    Both pipes are drained together, so a script writing a lot to one of them can't block on a full pipe.
+    The script runs in its own process group, which is terminated (then killed 10s later) when it runs
+    longer than `timeout` seconds or prints nothing for `idle_timeout` seconds.
+
+    Returns {"returncode", "duration", "stdout_bytes", "stderr_bytes", "timed_out", "lines"}, where
+    timed_out is None, "wall" or "idle" and lines holds the last (elapsed seconds, stream, line) tuples.
+    Raises ScriptError, carrying that result, when the script fails or times out and `check` is set.
+    """
+    # Ensure the bash script file has execute permissions
+    st = os.stat(script_path)  # Get the current permissions of the file
+    os.chmod(script_path, st.st_mode | stat.S_IEXEC)  # Add execute permission for the owner
+
+    start = time.monotonic()
+    result = { "returncode": None, "duration": 0.0, "stdout_bytes": 0, "stderr_bytes": 0, "timed_out": None, "lines": deque(maxlen=tail_lines) }
+    process = subprocess.Popen([script_path] + list(script_args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+
+    selector = selectors.DefaultSelector()
+    buffers = {}
+    for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr)):
+        selector.register(pipe, selectors.EVENT_READ, name)
+        buffers[name] = b""
+
+    def log_line(name, line):
+        elapsed = time.monotonic() - start
+        text = line.decode(errors="replace").rstrip()
+        result["lines"].append((round(elapsed, 3), name, text))
+        (logger.info if name == "stdout" else logger.error)(f"[{os.path.basename(script_path)} +{elapsed:.1f}s {name}] {text}")
+
+    last_output = start
     try:
-        # Ensure the bash script file has execute permissions
-        st = os.stat(script_path)  # Get the current permissions of the file
-        os.chmod(script_path, st.st_mode | stat.S_IEXEC)  # Add execute permission for the owner
-
-        # Use subprocess.Popen for real-time output
-        process = subprocess.Popen(
-            [script_path] + list(script_args),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        # Read from stdout and stderr in real-time
-        for line in process.stdout:
-            logger.info(line.strip())
-
-        for line in process.stderr:
-            logger.error(line.strip())
-
-        # Wait for the process to complete and get the return code
-        return_code = process.wait()
-
-        if return_code != 0:
-            logger.error(f"Script {script_path} failed with return code: {return_code}")
-            sys.exit(1)
-
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Script {script_path} failed with error: {e.stderr}")
-        sys.exit(1)
-    except Exception as e:
-        logger.error(f"Failed to execute script {script_path}: {str(e)}")
-        sys.exit(1)
+        while selector.get_map():
+            now = time.monotonic()
+            if timeout is not None and now - start >= timeout:
+                result["timed_out"] = "wall"
+            elif idle_timeout is not None and now - last_output >= idle_timeout:
+                result["timed_out"] = "idle"
+            if result["timed_out"]:
+                _stop_process_group(process)
+                break
+
+            deadlines = [start + timeout - now if timeout is not None else None, last_output + idle_timeout - now if idle_timeout is not None else None]
+            wait = min([deadline for deadline in deadlines if deadline is not None], default=None)
+            for key, _ in selector.select(wait):
+                name = key.data
+                data = os.read(key.fileobj.fileno(), 65536)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                last_output = time.monotonic()
+                result[f"{name}_bytes"] += len(data)
+                *lines, buffers[name] = (buffers[name] + data).split(b"\n")
+                for line in lines:
+                    log_line(name, line)
+    finally:
+        selector.close()
+
+    for name, buffer in buffers.items():
+        if buffer:
+            log_line(name, buffer)
+    result["returncode"] = process.wait()
+    result["duration"] = time.monotonic() - start
+    result["lines"] = list(result["lines"])
+    process.stdout.close()
+    process.stderr.close()
 
+    summary = f"Script {script_path} exited with return code {result['returncode']} after {result['duration']:.1f}s ({result['stdout_bytes']} bytes on stdout, {result['stderr_bytes']} on stderr)"
+    if result["timed_out"]:
+        limit = timeout if result["timed_out"] == "wall" else idle_timeout
+        message = f"Script {script_path} was stopped after {result['duration']:.1f}s: " + ("it ran longer than" if result["timed_out"] == "wall" else "no output for") + f" {limit}s"
+    elif result["returncode"] != 0:
+        message = summary
+    else:
+        logger.info(summary)
+        return result
+
+    logger.error(message)
+    if check:
+        raise ScriptError(message, result)
+    return result
+
+def _stop_process_group(process, grace_period=10):
+    """
+    Terminate the script and everything it started, killing whatever is left after the grace period.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
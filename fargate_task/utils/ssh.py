@@ -1,4 +1,12 @@
 import os
+import io
+import hashlib
+import random
+import shlex
+import socket
+import tarfile
+import threading
+from collections import deque
 import paramiko
 import time
 from .logger import setup_logging
@@ -7,37 +15,97 @@ from .logger import setup_logging
 logger = setup_logging()
 
 class SSHUtil:
-    def __init__(self, machine_ip, username, key_file, retries=5, wait=10):
+    def __init__(self, machine_ip, username, key_file, retries=5, wait=10, ready_timeout=300, port=22, cancel=None):
+        """
+        :param retries: Handshake attempts once sshd answers, the key may not be installed yet.
+        :param wait: Longest pause between two attempts, in seconds.
+        :param ready_timeout: Seconds to wait for the machine to become reachable and accept the key.
+        :param cancel: threading.Event that stops the wait when set, e.g. StepGraph.cancelled.
+        """
         self.machine_ip = machine_ip
         self.username = username
         self.key_file = key_file
         self.retries = retries
         self.wait = wait
+        self.ready_timeout = ready_timeout
+        self.port = port
+        self.cancel = cancel or threading.Event()
+        self.ready_seconds = None # Time until sshd answered with its banner
+        self.sftp = None # One SFTP session for every transfer, opened on first use
         self.ssh = self._connect()
         
     def _connect(self):
         """
-        Establish an SSH connection and return the client with retries.
+        Wait for sshd, then establish an SSH connection and return the client with retries.
         """
+        start = time.monotonic()
+        deadline = start + self.ready_timeout
+        self.wait_until_ready(deadline)
+        self.ready_seconds = time.monotonic() - start
+
         ssh = paramiko.SSHClient()
         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         
         for _ in range(self.retries):
             try:
-                ssh.connect(self.machine_ip, username=self.username, key_filename=self.key_file)
+                ssh.connect(self.machine_ip, port=self.port, username=self.username, key_filename=self.key_file, timeout=10, banner_timeout=10)
+                logger.info(f"Connected to {self.machine_ip} {time.monotonic() - start:.1f}s after the first attempt (sshd ready after {self.ready_seconds:.1f}s)")
                 return ssh
             except Exception as e:
                 logger.error(f"Error connecting to {self.machine_ip} on attempt {_ + 1}: {str(e)}")
-                if _ < self.retries - 1:  # if not on the last attempt
-                    time.sleep(self.wait)
+                if _ < self.retries - 1 and time.monotonic() < deadline:  # if not on the last attempt
+                    self._pause(min(self._backoff(_), max(deadline - time.monotonic(), 0)))
                 else:
                     raise
 
+    def wait_until_ready(self, deadline):
+        """
+        Poll the SSH port until sshd sends its banner. Probes are plain TCP connections with short timeouts,
+        spaced by exponential backoff with jitter capped at 2s, so a booting machine is picked up within
+        two seconds of sshd starting. Raises InterruptedError as soon as the cancel event is set.
+        """
+        attempt = 0
+        while True:
+            try:
+                with socket.create_connection((self.machine_ip, self.port), timeout=2) as probe:
+                    probe.settimeout(2)
+                    if probe.recv(256).startswith(b"SSH-"):
+                        if attempt:
+                            logger.info(f"sshd on {self.machine_ip} is ready after {attempt} probes")
+                        return
+            except OSError:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"SSH on {self.machine_ip}:{self.port} not ready after {self.ready_timeout}s")
+            self._pause(min(self._backoff(attempt, cap=2), remaining))
+            attempt += 1
+
+    def _pause(self, seconds):
+        if self.cancel.wait(seconds):
+            raise InterruptedError(f"Stopped waiting for SSH on {self.machine_ip}:{self.port}, cancelled")
+
+    def _backoff(self, attempt, cap=None):
+        """
+        Exponential backoff from 0.5s up to `cap` (default `wait`) seconds, jittered over the upper half.
+        """
+        delay = min(cap or self.wait, self.wait, 0.5 * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
 
     def __del__(self):
-        if self.ssh:
+        if self.sftp:
+            self.sftp.close()
+        if getattr(self, "ssh", None):
             self.ssh.close()
 
+    def _get_sftp(self):
+        if not self.ssh:
+            raise ConnectionError(f"Unable to establish SSH connection to {self.machine_ip}.")
+        if self.sftp is None or self.sftp.get_channel().closed:
+            self.sftp = self.ssh.open_sftp()
+        return self.sftp
+
     def run_command(self, command, capture_output=False):
         """
         SSH into the machine and run the provided command.
@@ -67,56 +135,153 @@ class SSHUtil:
         if capture_output:
             return out
         
-    def run_script(self, script_path, log_file_path, *args):
+    def file_exists(self, remote_path):
+        """
+        Check whether a file exists on the machine.
+        """
+        return self.run_command(f"test -f {remote_path} && echo yes || true", True) == "yes"
+
+    def run_script(self, script_path, log_file_path, *args, stream=True, timeout=None):
+        """
+        Run a bash script on the machine as root, its output written to log_file_path.
+
+        :param stream: Also log the output line by line as it arrives, with the elapsed time.
+        :param timeout: Seconds after which the script's process group is terminated, then killed
+                        30s later if it is still running.
+        """
         if not self.ssh:
             logger.error(f"SSH connection could not be established to {self.machine_ip}.")
             raise Exception(f"SSH connection could not be established to {self.machine_ip}.")
 
         # Convert args to a string
         args_str = ' '.join(args)
+        # timeout(1) runs the script in its own process group and signals the whole group
+        timeout_prefix = f"timeout --kill-after=30 {int(timeout)} " if timeout else ""
 
         try: 
-            # Run the bash script and redirect its output to a log file
-            stdin, stdout, stderr = self.ssh.exec_command(f"sudo bash {script_path} {args_str} > {log_file_path} 2>&1")
+            if not stream:
+                # Run the bash script and redirect its output to a log file
+                stdin, stdout, stderr = self.ssh.exec_command(f"sudo {timeout_prefix}bash {script_path} {args_str} > {log_file_path} 2>&1")
             
-            # Wait for the command to finish
-            exit_status = stdout.channel.recv_exit_status()
+                # Wait for the command to finish
+                exit_status = stdout.channel.recv_exit_status()
+                tail = None
+            else:
+                # Tee the output to the log file and stream it back, the exit status is the script's
+                command = f"set -o pipefail; sudo {timeout_prefix}bash {script_path} {args_str} 2>&1 | tee {log_file_path}"
+                stdin, stdout, stderr = self.ssh.exec_command(f"bash -c {shlex.quote(command)}")
+                exit_status, tail = self._stream_output(stdout.channel, os.path.basename(script_path), timeout)
 
+            if timeout and exit_status in (124, 137): # timeout(1): terminated, killed
+                raise TimeoutError(f"Script {script_path} timed out after {timeout}s and was stopped.")
             if exit_status != 0:
-                script_logs = self.read_file_output(log_file_path)
+                script_logs = "\n".join(tail) if tail is not None else self.read_file_output(log_file_path)
                 logger.error(f"{script_logs} \nScript exited with status code {exit_status}.")
                 raise Exception(f"Script exited with status code {exit_status}.")
         except Exception as e:
             logger.error(f"Failed to execute script on {self.machine_ip}: {str(e)}.")
             raise
 
-    def scp_to_machine(self, local_path, remote_path):
+    def _stream_output(self, channel, name, timeout=None, tail_lines=50):
         """
-        Copy a local file or directory to a remote machine via SCP.
+        Log a command's output line by line until it exits. Returns (exit status, last lines of output).
         """
-        if not self.ssh:
-            raise ConnectionError(f"Unable to establish SSH connection to {self.machine_ip}.")
+        start = time.monotonic()
+        tail = deque(maxlen=tail_lines)
+        buffer = b""
+        channel.settimeout(1.0)
+        logger.info(f"==> [{name}] started on {self.machine_ip}")
+
+        def log_lines(lines):
+            for line in lines:
+                text = line.decode(errors="replace").rstrip()
+                tail.append(text)
+                logger.info(f"[{name} +{time.monotonic() - start:.1f}s] {text}")
 
-        with paramiko.SFTPClient.from_transport(self.ssh.get_transport()) as scp:
+        while True:
             try:
-                scp.put(local_path, remote_path)
-            except Exception as e:
-                logger.error(f"Error copying {local_path} to {remote_path} on {self.machine_ip}: {str(e)}")
-                raise
+                data = channel.recv(4096)
+            except socket.timeout:
+                # The remote timeout stops the script, this only catches a connection that went silent
+                if timeout and time.monotonic() - start > timeout + 60:
+                    channel.close()
+                    raise TimeoutError(f"No exit status from {name} {timeout + 60}s after it started.")
+                continue
+            if not data:
+                break
+            *lines, buffer = (buffer + data).split(b"\n")
+            log_lines(lines)
+        if buffer:
+            log_lines([buffer])
+
+        exit_status = channel.recv_exit_status()
+        logger.info(f"<== [{name}] exited with status {exit_status} after {time.monotonic() - start:.1f}s")
+        return exit_status, list(tail)
+
+    def scp_to_machine(self, local_path, remote_path):
+        """
+        Copy a local file to a remote machine via SFTP.
+        """
+        try:
+            self._get_sftp().put(local_path, remote_path)
+        except Exception as e:
+            logger.error(f"Error copying {local_path} to {remote_path} on {self.machine_ip}: {str(e)}")
+            raise
+
+    def upload_files(self, files, directories=()):
+        """
+        Copy local files to the machine in one tar stream, skipping the ones whose remote SHA-256 already matches.
+        The remote directories, and those of the files, are created along the way.
+
+        :param files: {local path: remote path}, remote paths are relative to the user's home directory.
+        :param directories: Other remote directories to create.
+        :return: The remote paths that were uploaded.
+        """
+        for remote_path in [*files.values(), *directories]:
+            if os.path.isabs(remote_path):
+                raise ValueError(f"Remote path '{remote_path}' must be relative to the home directory.")
+
+        # One command creates the directories and hashes the files already on the machine
+        remote_dirs = sorted({*directories, *(os.path.dirname(path) for path in files.values() if os.path.dirname(path))})
+        mkdir = f"mkdir -p {' '.join(shlex.quote(path) for path in remote_dirs)} && " if remote_dirs else ""
+        output = self.run_command(f"{mkdir}(sha256sum {' '.join(shlex.quote(path) for path in files.values())} 2>/dev/null || true)", True) or ""
+        remote_hashes = {line.split(maxsplit=1)[1]: line.split(maxsplit=1)[0] for line in output.splitlines() if len(line.split(maxsplit=1)) == 2}
+
+        changed = {local: remote for local, remote in files.items() if remote_hashes.get(remote) != self._sha256(local)}
+        if changed:
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+                for local_path, remote_path in changed.items():
+                    tar.add(local_path, arcname=remote_path)
+
+            stdin, stdout, stderr = self.ssh.exec_command("tar -xzf -")
+            stdin.write(archive.getvalue())
+            stdin.channel.shutdown_write()
+            exit_status = stdout.channel.recv_exit_status()
+            if exit_status != 0:
+                err = stderr.read().decode().strip()
+                logger.error(f"Error uploading {', '.join(changed.values())} to {self.machine_ip}: {err}")
+                raise Exception(f"Upload exited with status code {exit_status}. Error: {err}")
+
+        logger.info(f"Uploaded {len(changed)} of {len(files)} files to {self.machine_ip}" + (f" in {archive.tell()} bytes" if changed else "") + f", {len(files) - len(changed)} already up to date")
+        return list(changed.values())
+
+    def _sha256(self, local_path):
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
 
     def read_file_output(self, file_path):
         """
         SSH into the machine and read the file contents.
         """
-        if not self.ssh:
-            raise ConnectionError(f"Unable to establish SSH connection to {self.machine_ip}.")
-        
-        with self.ssh.open_sftp() as sftp:
-            try:
-                with sftp.file(file_path, 'r') as f:
-                    content = f.read().decode()
-                logger.info(f"Read content from {file_path} successfully.")
-                return content
-            except Exception as e:
-                logger.error(f"Error while reading file '{file_path}': {e}")
-                raise
\ No newline at end of file
+        try:
+            with self._get_sftp().file(file_path, 'r') as f:
+                content = f.read().decode()
+            logger.info(f"Read content from {file_path} successfully.")
+            return content
+        except Exception as e:
+            logger.error(f"Error while reading file '{file_path}': {e}")
+            raise
\ No newline at end of file
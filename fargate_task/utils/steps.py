@@ -0,0 +1,138 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable
+from .checkpoints import fingerprint
+from .logger import setup_logging
+
+# Setting up logging
+logger = setup_logging()
+
+class StepError(Exception):
+    pass
+
+class StepGraph:
+    """
+    Steps with declared dependencies, run on a thread pool as soon as everything they depend on is done.
+
+    A step is a function taking the results of the steps run so far, {step name: return value}.
+    When a step fails, no new step starts, `cancelled` is set so long waits in the running steps can give
+    up early, the running ones finish and run() raises a StepError naming the failed step. Every step's duration is logged and kept in `timings`.
+
+    With a JobCheckpoint, steps added with `inputs` are recorded when they complete. On a rerun a recorded
+    step is skipped (its result is None) if its inputs and those of the steps it depends on are unchanged,
+    the checkpointed steps it depends on were skipped too and `verify`, when given, confirms that what it
+    produced is still there.
+    """
+    def __init__(self, name: str, max_workers: int = 4, checkpoint=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.checkpoint = checkpoint
+        self.steps: Dict[str, Dict[str, Any]] = {} # name -> {"func", "depends_on", "inputs", "verify"}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {} # name -> seconds
+        self.fingerprints: Dict[str, str] = {} # name -> fingerprint of the step's inputs
+        self.skipped = [] # Steps skipped thanks to the checkpoint
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event() # Set when a step fails
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], depends_on: Iterable[str] = (),
+            inputs: Callable[[Dict[str, Any]], Any] = None, verify: Callable[[Dict[str, Any]], bool] = None) -> str:
+        if name in self.steps:
+            raise ValueError(f"Step '{name}' is already in the '{self.name}' graph")
+        depends_on = tuple(depends_on)
+        unknown = [dependency for dependency in depends_on if dependency not in self.steps]
+        if unknown:
+            # Dependencies are added first, which also keeps the graph free of cycles
+            raise ValueError(f"Step '{name}' depends on unknown steps: {', '.join(unknown)}")
+        self.steps[name] = { "func": func, "depends_on": depends_on, "inputs": inputs, "verify": verify }
+        return name
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run every step and return their results.
+        """
+        start = time.monotonic()
+        pending = dict(self.steps)
+        running = {} # future -> step name
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as executor:
+            while pending or running:
+                if failure is None:
+                    for name in [name for name, step in pending.items() if all(d in self.results for d in step["depends_on"])]:
+                        running[executor.submit(self._run_step, name, pending.pop(name))] = name
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None and failure is None:
+                        failure = (name, error)
+                        self.cancelled.set()
+
+        if failure is not None:
+            name, error = failure
+            skipped = ", ".join(pending) or "none"
+            logger.error(f"{self.name}: step '{name}' failed after {self.timings.get(name, 0):.2f}s, skipped steps: {skipped}")
+            raise StepError(f"{self.name}: step '{name}' failed: {type(error).__name__}: {error}") from error
+
+        summary = ", ".join(f"{name} {seconds:.2f}s" + (" (checkpoint)" if name in self.skipped else "") for name, seconds in self.timings.items())
+        logger.info(f"{self.name} completed in {time.monotonic() - start:.2f}s ({summary})")
+        return self.results
+
+    def _run_step(self, name, step):
+        logger.info(f"{self.name}: starting step '{name}'")
+        start = time.monotonic()
+        try:
+            inputs = self._fingerprint(name, step)
+            if inputs is not None and self._is_checkpointed(name, step, inputs):
+                result = None
+                self.skipped.append(name)
+            else:
+                result = step["func"](self.results)
+                if inputs is not None:
+                    self.checkpoint.save(name, inputs, fingerprint(result))
+        finally:
+            with self.lock:
+                self.timings[name] = time.monotonic() - start
+        with self.lock:
+            self.results[name] = result
+        logger.info(f"{self.name}: step '{name}' {'skipped, completed by a previous run' if name in self.skipped else 'done'} in {self.timings[name]:.2f}s")
+        return result
+
+    def _fingerprint(self, name, step):
+        """
+        Fingerprint of the step's inputs and of the checkpointed steps it depends on, None when it isn't checkpointed.
+        """
+        if self.checkpoint is None or step["inputs"] is None:
+            return None
+        dependencies = {dependency: self.fingerprints[dependency] for dependency in self._checkpointed_ancestors(name)}
+        with self.lock:
+            self.fingerprints[name] = fingerprint({ "inputs": step["inputs"](self.results), "depends_on": dependencies })
+            return self.fingerprints[name]
+
+    def _checkpointed_ancestors(self, name):
+        """
+        The checkpointed steps the step depends on, directly or through other steps.
+        """
+        ancestors, to_visit = set(), list(self.steps[name]["depends_on"])
+        while to_visit:
+            dependency = to_visit.pop()
+            if dependency not in ancestors:
+                ancestors.add(dependency)
+                to_visit.extend(self.steps[dependency]["depends_on"])
+        return sorted(dependency for dependency in ancestors if dependency in self.fingerprints)
+
+    def _is_checkpointed(self, name, step, inputs):
+        record = self.checkpoint.get(name)
+        if record is None or record["inputs"] != inputs:
+            return False
+        if any(dependency not in self.skipped for dependency in self._checkpointed_ancestors(name)):
+            return False # A checkpointed step it depends on ran again
+        if step["verify"] is not None and not step["verify"](self.results):
+            logger.info(f"{self.name}: step '{name}' was completed by a previous run but its outputs are gone, running it again")
+            return False
+        return True
@@ -1,9 +1,20 @@
 import subprocess
+import json
 import os
+import threading
+import time
 from .logger import setup_logging
 
 logger = setup_logging()
 
+# Providers downloaded by one working directory are reused by every other one in the task
+PLUGIN_CACHE_DIR = os.getenv("TF_PLUGIN_CACHE_DIR", os.path.expanduser("~/.terraform.d/plugin-cache"))
+
+_terraform_version = None # `terraform -v` output, probed once per process
+# Terraform doesn't support concurrent inits sharing a plugin cache, so inits of different working
+# directories run one after the other, only the rest of their steps overlap
+_plugin_cache_lock = threading.Lock()
+
 class TerraformError(Exception):
     pass
 
@@ -17,12 +28,14 @@ class TerraformHelper:
             path (str): The working directory for Terraform commands.
         """
         self._validate_directory(path)
-        self._check_terraform_installed()
+        self.version = self._check_terraform_installed()
         
         self.path = path
+        self.outputs = None # Parsed `terraform output -json`, cleared by apply and destroy
+        self.init_seconds = 0.0
 
         # Run Terraform init during initialization
-        self.run_command("init")
+        self.init()
 
     def _validate_directory(self, path: str):
         """
@@ -35,15 +48,78 @@ class TerraformHelper:
 
     def _check_terraform_installed(self):
         """
-        Checks if Terraform is installed.
+        Checks if Terraform is installed. The binary doesn't change while the task runs,
+        so `terraform -v` only runs for the first helper.
+        """
+        global _terraform_version
+        if _terraform_version is None:
+            try:
+                output = subprocess.run(["terraform", "-v"], check=True, capture_output=True, text=True)
+            except subprocess.CalledProcessError:
+                raise TerraformError("Terraform command failed.")
+            except FileNotFoundError:
+                raise TerraformError("Terraform is not installed or not in PATH.")
+            _terraform_version = output.stdout.strip()
+        return _terraform_version
+
+    def init(self):
+        """
+        Run `terraform init` with the shared plugin cache, so providers already downloaded by another
+        working directory of the task are linked instead of downloaded again.
+        """
+        start = time.perf_counter()
+        os.makedirs(PLUGIN_CACHE_DIR, exist_ok=True)
+        with _plugin_cache_lock:
+            self.run_command("init", "-input=false")
+
+        self.init_seconds = time.perf_counter() - start
+        logger.info(f"terraform init in {self.path} ({self.init_seconds:.2f}s)")
+        return self.init_seconds
+
+    def get_outputs(self, refresh=False):
+        """
+        Return every output of the working directory as {name: value}, with values parsed from JSON
+        (numbers, lists and maps keep their types). All outputs are read with a single `terraform output -json`
+        and cached until the next apply or destroy.
+        """
+        if self.outputs is None or refresh:
+            try:
+                output = subprocess.run(["terraform", "output", "-json"], cwd=self.path, check=True, capture_output=True, text=True, env=self._env())
+            except subprocess.CalledProcessError as e:
+                raise TerraformError(f"Error running terraform output -json: {e.stderr}")
+            try:
+                self.outputs = {name: output["value"] for name, output in json.loads(output.stdout or "{}").items()}
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise TerraformError(f"Error parsing terraform outputs in {self.path}: {e}")
+            logger.info(f"Read {len(self.outputs)} Terraform outputs from {self.path}")
+        return self.outputs
+
+    def get_output(self, name):
+        """
+        Return a single output's value from the cached outputs.
+        """
+        outputs = self.get_outputs()
+        if name not in outputs:
+            raise TerraformError(f"Terraform output '{name}' not found in {self.path}")
+        return outputs[name]
+
+    def has_changes(self):
+        """
+        Whether `terraform plan` finds differences between the configuration and the infrastructure.
         """
         try:
-            subprocess.run(["terraform", "-v"], check=True, capture_output=True)
-        except subprocess.CalledProcessError:
-            raise TerraformError("Terraform command failed.")
-        except FileNotFoundError:
-            raise TerraformError("Terraform is not installed or not in PATH.")
-    
+            subprocess.run(["terraform", "plan", "-detailed-exitcode", "-input=false"], cwd=self.path, check=True, capture_output=True, text=True, env=self._env())
+        except subprocess.CalledProcessError as e:
+            if e.returncode == 2: # -detailed-exitcode: the plan has changes
+                return True
+            raise TerraformError(f"Error running terraform plan: {e.stderr}")
+        return False
+
+    def _env(self):
+        """
+        Environment of the terraform commands, with providers shared through the plugin cache.
+        """
+        return {**os.environ, "TF_PLUGIN_CACHE_DIR": PLUGIN_CACHE_DIR}
 
     def run_command(self, *args):
         """
@@ -59,15 +135,16 @@ class TerraformHelper:
         terraform_command = ["terraform"] + list(args)
         if args[0] in ["apply", "destroy"]:
             terraform_command.append("--auto-approve")
+            self.outputs = None # The outputs change with the state
 
-        # Run the terraform command
+        env = self._env()
         try:
             if args[0] == "output":
-                output = subprocess.run(terraform_command, cwd=self.path, check=True, capture_output=True, text=True)
+                output = subprocess.run(terraform_command, cwd=self.path, check=True, capture_output=True, text=True, env=env)
                 result = output.stdout.strip().strip('"')
                 return result
             else:
-                result = subprocess.run(terraform_command, cwd=self.path, check=True, capture_output=False, text=True)
+                result = subprocess.run(terraform_command, cwd=self.path, check=True, capture_output=False, text=True, env=env)
                 return result.stdout
         except subprocess.CalledProcessError as e:
             raise TerraformError(f"Error running terraform {args}: {e.stderr}")
@@ -0,0 +1,214 @@
+"""
+Benchmark lambda_handler locally, without an AWS account.
+
+Every action runs through lambda_handler against in-process stand-ins: a stubbed ECS cluster, a stubbed
+SSM Parameter Store and a local server speaking the Minecraft status protocol. Cold starts run in a
+fresh interpreter each, warm invocations reuse one execution environment. The report is JSON:
+p50/p95 latency, cold vs. warm init time and AWS calls per invocation by service and operation.
+
+Run from the lambda_function directory:
+    python benchmarks/run_benchmarks.py --iterations 50 --tasks 300 --mc-mode online --output bench.json
+"""
+import time
+PROCESS_START = time.perf_counter() # Cold samples are measured from interpreter start, before any import
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAMBDA_DIR)
+
+BOT_COMMAND_NAME = "mc_server/BOT_COMMAND"
+TAGS = { "Name": "mc-bench", "Namespace": "bench", "Stage": "prod" }
+ACTIONS = ("PING", "status", "start", "stop", "mc_world_archive", "status_snapshot")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark lambda_handler against local ECS, SSM and Minecraft stand-ins.")
+    parser.add_argument("--actions", nargs="+", default=list(ACTIONS), choices=ACTIONS)
+    parser.add_argument("--iterations", type=int, default=30, help="Warm invocations per action")
+    parser.add_argument("--cold-samples", type=int, default=3, help="Cold starts per action, each in a new interpreter")
+    parser.add_argument("--tasks", type=int, default=0, help="Unrelated tasks in the ECS cluster")
+    parser.add_argument("--servers", type=int, default=1, help="Other servers the unrelated tasks are spread over")
+    parser.add_argument("--tec-status", default=None, help="Status of a running TEC task, none by default")
+    parser.add_argument("--mc-mode", default="online", choices=("online", "refuse", "hang"))
+    parser.add_argument("--mc-delay", type=float, default=0, help="Seconds the fake server waits before answering")
+    parser.add_argument("--aws-latency-ms", type=float, default=0, help="Latency added to every stubbed ECS and SSM call")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    parser.add_argument("--mc-port", type=int, help=argparse.SUPPRESS) # Set for cold start child processes
+    parser.add_argument("--cold-child", choices=ACTIONS, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def configure_environment(mc_port):
+    os.environ.update({
+        "AWS_DEFAULT_REGION": "eu-west-2",
+        "MC_SERVER_IP": "127.0.0.1",
+        "MC_PORT": str(mc_port),
+        "CLUSTER": "bench-cluster",
+        "CONTAINER_NAME": "bench-container",
+        "SUBNET_ID": "subnet-bench",
+        "SECURITY_GROUP_ID": "sg-bench",
+        "TASK_DEFINITION_NAME": "bench-task",
+        "TF_USER_TOKEN": "bench/tf-token",
+        "BOT_COMMAND_NAME": BOT_COMMAND_NAME,
+        "GIT_PRIVATE_KEY": "bench/git-key",
+        "EC2_PRIVATE_KEY": "bench/ec2-key",
+        "TAGS_JSON": json.dumps(TAGS),
+    })
+
+def build_event(action):
+    body = { "action": action }
+    if action == "status_snapshot":
+        body["snapshot"] = { "seq": 1, "online": True, "players_online": 2, "version": "1.20.1", "timer_status": "RESET", "time_without_players": 0, "timestamp": "bench" }
+    return { "body": json.dumps(body), "headers": {} }
+
+def install(args):
+    """
+    Import the Lambda and point its execution environment at the stand-ins. Returns (lambda module, ecs, ssm).
+    """
+    import lambda_function
+    from utils.logger import setup_logging
+    from utils.runtime import get_runtime_context
+    from benchmarks.stubs import StubECS, StubSSM
+
+    setup_logging()
+    logging.getLogger().setLevel(args.log_level)
+    tec_tags = { "TAG_NAME": TAGS["Name"], "TAG_NAMESPACE": TAGS["Namespace"], "TAG_ENVIRONMENT": TAGS["Stage"], "TAG_RUNNING_COMMAND": "start", "TAG_SERVER_ID": "default" }
+    ecs = StubECS(tec_tags, args.tasks, args.tec_status, args.aws_latency_ms / 1000, args.servers)
+    ssm = StubSSM({ BOT_COMMAND_NAME: "status" }, args.aws_latency_ms / 1000)
+    runtime = get_runtime_context(lambda_function.INIT_START)
+    runtime.clients.update(ecs=ecs, ssm=ssm)
+    return lambda_function, ecs, ssm
+
+def invoke(lambda_module, ecs, ssm, action):
+    """
+    Run one invocation from the stand-ins' initial state and return its measurements.
+    """
+    ecs.reset()
+    ssm.reset()
+    ecs_before, ssm_before = ecs.calls.copy(), ssm.calls.copy()
+
+    with contextlib.redirect_stdout(io.StringIO()): # Keep the per-invocation EMF records out of the report
+        start = time.perf_counter()
+        response = lambda_module.lambda_handler(build_event(action), None)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+    body = json.loads(response.get("body") or "{}")
+    return {
+        "latency_ms": latency_ms,
+        "status_code": response["statusCode"],
+        "info": body.get("INFO", body.get("error")),
+        "runtime": body.get("RUNTIME", {}),
+        "calls": { "ecs": dict(ecs.calls - ecs_before), "ssm": dict(ssm.calls - ssm_before) },
+    }
+
+def run_cold_child(args):
+    """
+    Measure one cold start: import the Lambda in this fresh interpreter and run its first invocation.
+    """
+    configure_environment(args.mc_port)
+    import_start = time.perf_counter()
+    lambda_module, ecs, ssm = install(args)
+    import_ms = (time.perf_counter() - import_start) * 1000
+    result = invoke(lambda_module, ecs, ssm, args.cold_child)
+    result.update(import_ms=import_ms, process_ms=(time.perf_counter() - PROCESS_START) * 1000)
+    print(json.dumps(result))
+
+def run_cold_samples(args, action, mc_port):
+    samples = []
+    command = [sys.executable, os.path.abspath(__file__), "--cold-child", action, "--mc-port", str(mc_port),
+               "--tasks", str(args.tasks), "--servers", str(args.servers), "--mc-mode", args.mc_mode, "--aws-latency-ms", str(args.aws_latency_ms), "--log-level", "ERROR"]
+    if args.tec_status is not None:
+        command += ["--tec-status", args.tec_status]
+    for _ in range(args.cold_samples):
+        output = subprocess.run(command, cwd=LAMBDA_DIR, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = lambda p: ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] # Nearest rank
+    return {
+        "p50": round(rank(50), 3),
+        "p95": round(rank(95), 3),
+        "mean": round(statistics.fmean(ordered), 3),
+        "min": round(ordered[0], 3),
+        "max": round(ordered[-1], 3),
+    }
+
+def average_calls(samples):
+    totals = {}
+    for sample in samples:
+        for service, calls in sample["calls"].items():
+            for operation, count in calls.items():
+                totals.setdefault(service, {}).setdefault(operation, 0)
+                totals[service][operation] += count
+    return {service: {operation: round(count / len(samples), 3) for operation, count in calls.items()} for service, calls in totals.items()}
+
+def summarize(cold, warm, mc_connections):
+    status_codes = {}
+    for sample in cold + warm:
+        status_codes[str(sample["status_code"])] = status_codes.get(str(sample["status_code"]), 0) + 1
+
+    return {
+        "path": (warm or cold)[0]["info"],
+        "status_codes": status_codes,
+        "cold": {
+            "samples": len(cold),
+            "first_invocation_ms": percentiles([sample["latency_ms"] for sample in cold]),
+            "import_ms": percentiles([sample["import_ms"] for sample in cold]),
+            "environment_init_ms": percentiles([sample["runtime"].get("cold_init_ms", 0) for sample in cold]),
+            "handler_init_ms": percentiles([sample["runtime"].get("init_ms", 0) for sample in cold]),
+            "calls_per_invocation": average_calls(cold) if cold else None,
+        },
+        "warm": {
+            "samples": len(warm),
+            "latency_ms": percentiles([sample["latency_ms"] for sample in warm]),
+            "handler_init_ms": percentiles([sample["runtime"].get("init_ms", 0) for sample in warm]),
+            "calls_per_invocation": average_calls(warm) if warm else None,
+            "minecraft_connections_per_invocation": round(mc_connections / len(warm), 3) if warm else None,
+        },
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cold_child:
+        return run_cold_child(args)
+
+    from benchmarks.stubs import FakeMinecraftServer
+    with FakeMinecraftServer(args.mc_mode, args.mc_delay) as mc_server:
+        configure_environment(mc_server.port)
+        lambda_module, ecs, ssm = install(args)
+
+        report = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("cold_child", "mc_port", "output", "log_level")},
+            "python": sys.version.split()[0],
+            "actions": {},
+        }
+        for action in args.actions:
+            cold = run_cold_samples(args, action, mc_server.port)
+
+            invoke(lambda_module, ecs, ssm, action) # Warm-up, the first invocation in this process is the cold one
+            connections_before = mc_server.connections
+            warm = [invoke(lambda_module, ecs, ssm, action) for _ in range(args.iterations)]
+            report["actions"][action] = summarize(cold, warm, mc_server.connections - connections_before)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
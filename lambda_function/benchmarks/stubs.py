@@ -0,0 +1,230 @@
+import json
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List
+from utils.ssm import LocalSSMClient
+
+class StubECS:
+    """
+    In-process stand-in for the boto3 ECS client, with `task_count` unrelated tasks spread over `servers`
+    other servers and optionally a running TEC tagged like the Lambda's. Every call can be slowed down
+    by `latency` seconds.
+    """
+    PAGE_SIZE = 100 # list_tasks returns at most 100 ARNs per page
+
+    def __init__(self, tec_tags: Dict[str, str], task_count: int = 0, tec_status: str = None, latency: float = 0, servers: int = 1, started_by: str = "mc-tec/default"):
+        self.tec_tags = tec_tags
+        self.task_count = task_count
+        self.tec_status = tec_status
+        self.latency = latency
+        self.servers = servers
+        self.started_by = started_by
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Put the cluster back in its initial state, launched tasks are discarded.
+        """
+        self.tasks = []
+        for i in range(self.task_count):
+            server_id = f"server-{i % self.servers}"
+            other_tags = {**self.tec_tags, "TAG_SERVER_ID": server_id}
+            self.tasks.append(self._task(f"arn:aws:ecs:eu-west-2:000000000000:task/bench/{i:06d}", "RUNNING", other_tags, f"mc-tec/{server_id}"))
+        if self.tec_status is not None:
+            self.tasks.append(self._task("arn:aws:ecs:eu-west-2:000000000000:task/bench/tec", self.tec_status, self.tec_tags, self.started_by))
+
+    def get_paginator(self, operation):
+        stub = self
+        class Paginator:
+            def paginate(self, startedBy=None, **kwargs):
+                arns = [task["taskArn"] for task in stub.tasks if startedBy is None or task["startedBy"] == startedBy]
+                for i in range(0, max(len(arns), 1), stub.PAGE_SIZE):
+                    stub._call("list_tasks")
+                    yield { "taskArns": arns[i:i + stub.PAGE_SIZE] }
+        return Paginator()
+
+    def describe_tasks(self, cluster, tasks, include=None):
+        self._call("describe_tasks")
+        if len(tasks) > 100:
+            raise ValueError("describe_tasks accepts at most 100 tasks")
+        wanted = set(tasks)
+        return { "tasks": [task for task in self.tasks if task["taskArn"] in wanted], "failures": [] }
+
+    def run_task(self, tags, startedBy=None, **kwargs):
+        self._call("run_task")
+        task = self._task(f"arn:aws:ecs:eu-west-2:000000000000:task/bench/launched-{len(self.tasks)}", "PROVISIONING", {tag["key"]: tag["value"] for tag in tags}, startedBy)
+        with self.lock:
+            self.tasks.append(task)
+        return { "tasks": [task], "failures": [] }
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _task(self, arn, status, tags, started_by):
+        return { "taskArn": arn, "lastStatus": status, "startedBy": started_by, "tags": [{"key": key, "value": value} for key, value in tags.items()] }
+
+class StubSSM(LocalSSMClient):
+    """
+    LocalSSMClient that counts calls, adds `latency` seconds to each and can be reset to its seed parameters.
+    """
+    def __init__(self, seed: Dict[str, str], latency: float = 0):
+        super().__init__()
+        self.seed = seed
+        self.latency = latency
+        self.calls = Counter()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.parameters = {name: { "Name": name, "Value": value, "Type": "String", "Version": 1 } for name, value in self.seed.items()}
+
+    def put_parameter(self, *args, **kwargs):
+        self._call("put_parameter")
+        return super().put_parameter(*args, **kwargs)
+
+    def get_parameter(self, *args, **kwargs):
+        self._call("get_parameter")
+        return super().get_parameter(*args, **kwargs)
+
+    def get_parameters(self, *args, **kwargs):
+        self._call("get_parameters")
+        return super().get_parameters(*args, **kwargs)
+
+    def delete_parameter(self, *args, **kwargs):
+        self._call("delete_parameter")
+        return super().delete_parameter(*args, **kwargs)
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+class FakeMinecraftServer:
+    """
+    Local TCP server speaking the Minecraft status protocol (handshake, status request and ping).
+
+    Modes: "online" answers after `delay` seconds, "refuse" leaves the port closed and "hang" accepts
+    connections but never answers, so clients hit their read timeout.
+    """
+    def __init__(self, mode: str = "online", delay: float = 0, players_online: int = 2, version: str = "1.20.1"):
+        if mode not in ("online", "refuse", "hang"):
+            raise ValueError(f"Invalid mode: {mode}")
+        self.mode = mode
+        self.delay = delay
+        self.status = json.dumps({
+            "version": { "name": version, "protocol": 763 },
+            "players": { "online": players_online, "max": 20 },
+            "description": "benchmark"
+        }).encode()
+        self.connections = 0
+        self.socket = None
+        self.port = None
+        self.running = False
+
+    def start(self) -> "FakeMinecraftServer":
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("127.0.0.1", 0))
+        self.port = listener.getsockname()[1]
+        if self.mode == "refuse":
+            # Nothing listens on the port, connections are refused
+            listener.close()
+            return self
+
+        listener.listen(64)
+        self.socket = listener
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.running = False
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        try:
+            if self.mode == "hang":
+                connection.recv(1024)
+                time.sleep(30)
+                return
+
+            while True:
+                packet = self._read_packet(connection)
+                if packet is None:
+                    return
+                packet_id, data = packet[0], packet[1:]
+                if packet_id == 0 and data:
+                    continue # Handshake, the status request follows
+                if packet_id == 0:
+                    time.sleep(self.delay)
+                    self._send_packet(connection, self._varint(0) + self._varint(len(self.status)) + self.status)
+                elif packet_id == 1:
+                    self._send_packet(connection, packet)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def _read_packet(self, connection):
+        length = self._read_varint(connection)
+        if length is None:
+            return None
+        data = b""
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_varint(self, connection):
+        value = 0
+        for i in range(5):
+            byte = connection.recv(1)
+            if not byte:
+                return None
+            value |= (byte[0] & 0x7F) << (7 * i)
+            if not byte[0] & 0x80:
+                return value
+        raise OSError("VarInt is too big")
+
+    def _send_packet(self, connection, payload):
+        connection.sendall(self._varint(len(payload)) + payload)
+
+    @staticmethod
+    def _varint(value):
+        out = b""
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            if value:
+                out += struct.pack("B", byte | 0x80)
+            else:
+                return out + struct.pack("B", byte)
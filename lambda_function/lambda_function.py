@@ -1,45 +1,165 @@
-import boto3
 import time
+INIT_START = time.perf_counter() # Start of the cold start, before the heavier imports below
+
+import boto3
 import json
+import hashlib
 from botocore.exceptions import BotoCoreError, ClientError
 from utils.event_parser import APIEventParser
-from utils.env_manager import EnvironmentVariables
-from utils.minecraft import MinecraftServer
 from utils.fargate import Fargate
-from utils.time_utils import seconds_to_minutes, DateTimeEncoder
-from utils.ssm import SSMUtil
-from utils.logger import setup_logging
+from utils.time_utils import DateTimeEncoder
+from utils.ssm import SSMUtil, ParameterNotFoundError
+from utils.registry import ServerRegistry
+from utils.jobs import JobStore
+from utils.guard import LaunchGuard
+from utils.status_snapshot import StatusSnapshotStore
+from utils.waiter import StateWaiter
+from utils.authorizer import Authorization, AuthorizationError
+from utils.facts import FactResolver, ProbeTimeoutError
+from utils.runtime import get_runtime_context
+from utils.metrics import start_trace, span
+
+# Facts each action needs before it can decide what to do. Only these are resolved for the action.
+TASK_FACTS = ("mc_server_status", "is_task_running", "task_status", "prev_command", "pending_jobs")
+ACTION_FACTS = {
+    "PING": (),
+    "mc_world_archive": ("is_task_running", "task_status", "prev_command", "pending_jobs"),
+    "start": TASK_FACTS,
+    "stop": TASK_FACTS,
+    "status": ("status_snapshot",) + TASK_FACTS,
+    "status_snapshot": (),
+}
+
+# Facts started up front when the action may not need all of its facts, the rest are resolved on demand
+ACTION_PREFETCH = {
+    "start": ("mc_server_status",), # The task facts are only needed when the server isn't already up
+    "stop": ("mc_server_status",),
+    "status": ("status_snapshot",),
+}
+
+# Seconds each probe may take before the handler stops waiting for it
+PROBE_DEADLINES = {
+    "mc_server_status": 3,
+    "is_task_running": 10,
+    "task_status": 10,
+    "prev_command": 5,
+    "pending_jobs": 5,
+    "status_snapshot": 5,
+}
+
+# Seconds a launch lock may go without a task attached before it is considered abandoned
+LAUNCH_ATTACH_TIMEOUT = 120
+
+# Values used when a probe misses its deadline, probes without one fail the request
+PROBE_DEFAULTS = {
+    "mc_server_status": { 'online': False, 'players_online': 0, 'version': 'unknown', 'timed_out': True },
+    "status_snapshot": None, # Fall back to probing live
+}
+
+# Response fields left out of the ETag, they change on every call
+VOLATILE_RESPONSE_FIELDS = ("RUNTIME", "PROBES", "SNAPSHOT", "WAIT")
+
+# States a request can wait for with "wait_for"
+WAIT_TARGETS = ("MC_SERVER_UP", "MC_SERVER_DOWN", "TASK_RUNNING", "TASK_STOPPED", "JOB_FINISHED")
 
 class LambdaHandler:
-    def __init__(self, event):
+    def __init__(self, event, runtime):
         # Note: May also need to add to check fargate for if the required image is in ECR.
+        handler_init_start = time.perf_counter()
+        self.runtime = runtime
+        self.invocation = self.runtime.start_invocation()
+
         # Setting up logging
-        self.logger = setup_logging() 
+        self.logger = self.runtime.logger
         
         # Parse the event
+        self.event = event
         event_parser = APIEventParser(event)
         event_body = event_parser.parse()
         self.logger.info(f"Event Body: \n{event_body}")
 
         # Extract the action from the parsed event
         self.ACTION = event_body["action"]
+        self.JOB_ID = event_body["job_id"]
+        self.SNAPSHOT = event_body["snapshot"]
+        self.IF_NONE_MATCH = event_body["if_none_match"]
+        self.WAIT_FOR = event_body["wait_for"]
+        self.wait_timeout = event_body["wait_timeout"]
+
+        # Get the environment variables specific to the action (parsed once per execution environment)
+        self.envs = self.runtime.get_envs(self.ACTION)
+
+        # Initialize SSM class
+        self.ssm = SSMUtil(store=self.runtime.get_parameter_store(float(self.envs["SSM_CACHE_TTL"]), self.envs["SSM_BACKEND"]))
+        self.ssm_calls_at_start = self.ssm.store.calls.copy() # The store is shared by warm invocations
+        self.authorizer = Authorization(self.envs["AUTH_TOKEN_NAME"], self.ssm, float(self.envs["AUTH_TOKEN_TTL"])) if self.envs["AUTH_TOKEN_NAME"] else None
+        self.authorize() # Rejected requests stop here, before the registry or any probe is read
 
-        # Get the environment variables specific to the action
-        self.envs = EnvironmentVariables(self.ACTION).get_vars()  # Get Environment Variables
+        # Switch to the requested server's configuration
+        registry = ServerRegistry(self.ssm, self.envs["SERVER_REGISTRY_NAME"], self.envs["SERVER_REGISTRY_JSON"])
+        self.envs = registry.resolve(event_body["server_id"], self.envs, self.ACTION)
+        self.SERVER_ID = self.envs["SERVER_ID"]
 
         # Initialize Fargate class
-        self.tec_fargate = Fargate(self.envs['CLUSTER'], self.envs)  # TEC means Terraform Execution Container
+        self.tec_fargate = Fargate(self.envs['CLUSTER'], self.envs, client=self.runtime.get_client('ecs'))  # TEC means Terraform Execution Container
         self.task_tags = self.tec_fargate.get_task_tags()
+        self.jobs = JobStore(self.ssm, self.envs["BOT_COMMAND_NAME"], float(self.envs["JOB_DISPATCH_TIMEOUT"]), float(self.envs["JOB_HEARTBEAT_TIMEOUT"]))
+        self.launch_guard = LaunchGuard(self.ssm, self.envs["BOT_COMMAND_NAME"], int(self.envs["LAUNCH_LOCK_TTL"]), LAUNCH_ATTACH_TIMEOUT)
+        self.status_snapshots = StatusSnapshotStore(self.ssm, self.envs["BOT_COMMAND_NAME"], float(self.envs["STATUS_SNAPSHOT_MAX_AGE"]), self.jobs)
 
-        # Initialize SSM class
-        self.ssm = SSMUtil()
+        # Checks are started together, only for the facts the action needs
+        self.facts = FactResolver({
+            "mc_server_status": self.check_mc_server, # Check If minecraft server is online/offline
+            "is_task_running": lambda: self.tec_fargate.is_task_with_tags_exists(self.task_tags), # Check if there's a Fargate task running
+            "task_status": lambda: self.tec_fargate.check_task_status(self.task_tags),
+            "prev_command": self.get_prev_command,
+            "pending_jobs": self.jobs.pending,
+            "status_snapshot": self.status_snapshots.fresh,
+        }, ACTION_FACTS.get(self.ACTION, ()), PROBE_DEADLINES, PROBE_DEFAULTS)
+        self.facts.prefetch(ACTION_PREFETCH.get(self.ACTION))
+
+        self.invocation["init_ms"] = round((time.perf_counter() - handler_init_start) * 1000, 3)
+        self.logger.info(f"{'Cold' if self.invocation['cold_start'] else 'Warm'} invocation {self.invocation['invocation']}: "
+                         f"environment init {self.invocation['cold_init_ms']} ms, handler init {self.invocation['init_ms']} ms")
 
-        # Perform checks
-        self.mc_server_status = MinecraftServer(self.envs["MC_SERVER_IP"], self.envs["MC_PORT"]).check()  # Check If minecraft server is online/offline
-        self.is_task_running = self.tec_fargate.is_task_with_tags_exists(self.task_tags)  # Check if there's a Fargate task running
+    def authorize(self):
+        """
+        Check the bearer token before the server's configuration is resolved. Raises AuthorizationError.
+        """
+        if self.authorizer is None:
+            return
+        with span("auth.check"):
+            self.authorizer.check(self.event)
+
+    def get_prev_command(self):
+        """
+        The last command sent to the server's TEC, None for a server that never ran one.
+        """
+        try:
+            return self.ssm.get_param(self.envs["BOT_COMMAND_NAME"])
+        except ParameterNotFoundError:
+            return None
+
+    def check_mc_server(self, cache_ttl=None):
+        """
+        Check if the minecraft server is online/offline.
+        """
+        # mcstatus is only imported by the actions that probe the server
+        from utils.minecraft import MinecraftServer
+        return MinecraftServer(
+            self.envs["MC_SERVER_IP"],
+            self.envs["MC_PORT"],
+            cache_ttl=float(self.envs["MC_STATUS_CACHE_TTL"]) if cache_ttl is None else cache_ttl,
+            connect_timeout=float(self.envs["MC_CONNECT_TIMEOUT"])
+        ).check()
     
     def execute_command(self):
         try:
+            if self.WAIT_FOR is not None and self.WAIT_FOR not in WAIT_TARGETS:
+                raise ValueError(f"Invalid wait_for: {self.WAIT_FOR}, expected one of {', '.join(WAIT_TARGETS)}")
+            if self.WAIT_FOR == "JOB_FINISHED" and self.ACTION == "status" and self.JOB_ID is None:
+                raise ValueError("wait_for JOB_FINISHED needs a job_id")
+
             if self.ACTION == "PING":
                 response = self.handle_ping()
             elif self.ACTION == "mc_world_archive":
@@ -50,13 +170,28 @@ class LambdaHandler:
                 response = self.handle_stop()
             elif self.ACTION == 'status':
                 response = self.handle_status()
+            elif self.ACTION == 'status_snapshot':
+                response = self.handle_status_snapshot()
             else:
                 raise ValueError(f"Invalid command: {self.ACTION}")
             
+            if self.WAIT_FOR is not None:
+                response["WAIT"] = self.wait_for_state(self.WAIT_FOR, response.get("JOB_ID", self.JOB_ID))
+            response["SERVER_ID"] = self.SERVER_ID
+            response["RUNTIME"] = self.invocation
+            response["PROBES"] = self.facts.timings
+            if self.ACTION == 'status':
+                return self.conditional_response(response)
             return {
                 "statusCode": 200,
                 "body": json.dumps(response, cls=DateTimeEncoder)
             }
+        except ProbeTimeoutError as error:
+            self.logger.error("Probe timed out", extra={"error": str(error)})
+            return {
+                "statusCode": 504,
+                "body": json.dumps({"error": str(error)}, cls=DateTimeEncoder)
+            }
         except ValueError as error:
             self.logger.error("Value error occurred", extra={"error": str(error)})
             return {
@@ -75,15 +210,38 @@ class LambdaHandler:
                 "statusCode": 500,
                 "body": json.dumps({"error": str(error)}, cls=DateTimeEncoder)
             }
+        finally:
+            # The handler has decided, stop waiting on the probes it didn't need
+            self.facts.close()
         
-    def launch_new_fargate_task(self):
+    def launch_new_fargate_task(self, action=None, job_id=None):
         """
-        Launch a new Fargate task and return its status.
+        Launch a new Fargate task and return its ARN and status. Defaults to running the requested action.
+
+        Only one launch can be in flight. If another invocation holds the launch lock, nothing is launched
+        and its task is returned instead, with "coalesced" set.
         """
-        self.ssm.send_param(self.ACTION, "String", self.envs["BOT_COMMAND_NAME"])
+        action = action or self.ACTION
+        acquired, lock = self.launch_guard.acquire(action, self.is_launch_lock_alive)
+        if not acquired:
+            task_arn = lock.get("task_arn") if lock else None
+            task = self.tec_fargate.describe_task(task_arn) if task_arn else None
+            return { "task_arn": task_arn, "task_status": task["lastStatus"] if task else "LAUNCH_IN_PROGRESS", "action": lock["action"] if lock else None, "coalesced": True }
+
+        try:
+            self.ssm.send_param(action, "String", self.envs["BOT_COMMAND_NAME"])
 
-        # Launch Fargate Container
-        task_arn = self.tec_fargate.create_fargate_container()
+            # Launch Fargate Container, it releases the launch lock when it exits
+            extra_environment = { "LAUNCH_LOCK_OWNER": lock["owner"] }
+            if job_id is not None:
+                extra_environment["JOB_ID"] = job_id
+            task_arn = self.tec_fargate.create_fargate_container(action, extra_environment)
+        except Exception:
+            self.launch_guard.release(lock)
+            raise
+        if not self.launch_guard.attach_task(lock, task_arn):
+            # Taken as abandoned and broken, a later launch may run next to this task. Their jobs are claimed one at a time
+            self.logger.warning(f"Launch lock was broken before task {task_arn} was attached, it no longer guards this task")
         self.logger.info(f"New Fargate task launched: {task_arn}")
 
         # Confirm the task i running
@@ -91,73 +249,185 @@ class LambdaHandler:
         if task_status is None:
             raise Exception(f"Error running Starting Task: {task_arn}")
         
-        return task_arn, task_status
-        
+        return { "task_arn": task_arn, "task_status": task_status, "action": action, "coalesced": False }
+
+    def is_launch_lock_alive(self, lock):
+        """
+        A launch lock is stale once its task has stopped, or if no task was attached to it shortly after it was taken.
+        """
+        if lock.get("task_arn") is None:
+            return time.time() - lock["acquired_at"] < LAUNCH_ATTACH_TIMEOUT
+        task = self.tec_fargate.describe_task(lock["task_arn"])
+        return task is not None and task["lastStatus"] != "STOPPED"
+
+    def submit_command(self, info, queued_status="QUEUED"):
+        """
+        Queue the action for the TEC. If no TEC is running, one is launched for the oldest queued job
+        and it drains the rest of the queue before it exits.
+        """
+        pending_jobs = self.facts.get("pending_jobs")
+        if self.facts.get("is_task_running"):
+            prev_command = self.facts.get("prev_command")
+            if not pending_jobs and prev_command == self.ACTION:
+                return {'STATUS': self.facts.get("task_status"), 'COMMAND': prev_command, "INFO": f"{self.ACTION.upper()} ALREADY IN PROGRESS"}
+
+            job = self.jobs.enqueue(self.ACTION)
+            if job["state"] != JobStore.PENDING:
+                return {'STATUS': self.facts.get("task_status"), 'COMMAND': self.ACTION, "JOB_ID": job["id"], "INFO": f"{self.ACTION.upper()} ALREADY IN PROGRESS"}
+            return {'STATUS': queued_status, 'COMMAND': self.ACTION, "JOB_ID": job["id"], "INFO": f"TEC IS BUSY WITH '{prev_command}', COMMAND QUEUED"}
+
+        job = self.jobs.enqueue(self.ACTION)
+        if job["state"] != JobStore.PENDING:
+            # Deduplicated into a job a task was launched for, it's only listed once that task starts
+            return {'STATUS': job.get("task_status", "PROVISIONING"), 'COMMAND': self.ACTION, "JOB_ID": job["id"], "INFO": f"{self.ACTION.upper()} ALREADY IN PROGRESS"}
+        dispatched = self.dispatch_pending_job(pending_jobs[0] if pending_jobs else job)
+        if dispatched["state"] == JobStore.PENDING:
+            # Another invocation launched a TEC in the meantime, it will drain the queue
+            return {'STATUS': queued_status, 'COMMAND': self.ACTION, "JOB_ID": job["id"], "INFO": f"TEC IS STARTING, COMMAND QUEUED"}
+        if dispatched["id"] != job["id"]:
+            info = f"{info} AFTER {len(pending_jobs)} QUEUED COMMANDS"
+        return {"STATUS": dispatched["task_status"], "COMMAND": self.ACTION, "JOB_ID": job["id"], "TASK_ARN": dispatched["task_arn"], "INFO": info}
+
     def handle_start(self):
-        if self.mc_server_status["online"]:
+        if self.facts.get("mc_server_status")["online"]:
             return {"STATUS": "MC_SERVER_UP", "COMMAND": self.ACTION, "INFO": "MINECRAFT SERVER ALREADY ONLINE"}
+        self.facts.prefetch(TASK_FACTS)
 
-        if self.is_task_running:
-            task_status = self.tec_fargate.check_task_status(self.task_tags)
-            prev_command = self.ssm.get_param(self.envs["BOT_COMMAND_NAME"])
-            return {'STATUS': task_status, 'COMMAND': prev_command, "INFO": "SERVER IS ALREADY STARTED"}
-        else:
-            task_arn, task_status = self.launch_new_fargate_task()
-            return {"STATUS": task_status, "COMMAND": self.ACTION, "INFO": "STARTING MINECRAFT SERVER"}
+        return self.submit_command("STARTING MINECRAFT SERVER")
 
     def handle_stop(self):
-        if not self.mc_server_status["online"]:
+        mc_server_status = self.facts.get("mc_server_status")
+        # A probe that timed out reads as offline, the server's state is unknown so the stop goes ahead
+        if not mc_server_status["online"] and not mc_server_status.get("timed_out"):
             return {"STATUS": "MC_SERVER_DOWN", "COMMAND": self.ACTION, "INFO": "MINECRAFT SERVER ALREADY OFFLINE"}
+        self.facts.prefetch(TASK_FACTS)
 
-        if self.is_task_running:
-            task_status = self.tec_fargate.check_task_status(self.task_tags)
-            prev_command = self.ssm.get_param(self.envs["BOT_COMMAND_NAME"])
-            return {'STATUS': task_status, 'COMMAND': prev_command, "INFO": "SERVER IS ALREADY STOPPED"}
-        else:
-            task_arn, task_status = self.launch_new_fargate_task()
-            return {"STATUS": task_status, "COMMAND": self.ACTION, "INFO": "STOPPING MINECRAFT SERVER"}
+        return self.submit_command("STOPPING MINECRAFT SERVER")
+
+    def wait_for_state(self, target, job_id=None):
+        """
+        Hold the request until the target state is reached or the wait times out, so clients
+        don't have to poll status. The wait is capped by WAIT_FOR_MAX_SECONDS.
+        """
+        max_wait = float(self.envs["WAIT_FOR_MAX_SECONDS"])
+        timeout = min(float(self.wait_timeout), max_wait) if self.wait_timeout is not None else max_wait
+        if target == "JOB_FINISHED" and job_id is None:
+            # The command didn't queue a job, e.g. the server was already in the requested state
+            return { "target": target, "reached": False, "state": "NO_JOB", "polls": 0, "waited_s": 0 }
+
+        result = StateWaiter(max(timeout, 0)).wait(lambda: self.observe_state(target, job_id))
+        return { "target": target, **result }
+
+    def observe_state(self, target, job_id=None):
+        """
+        Observe the state behind a wait target. Returns (reached, observed state).
+        """
+        if target in ("MC_SERVER_UP", "MC_SERVER_DOWN"):
+            # The sidecar's snapshot is used while it is fresh, otherwise the server is probed
+            fresh = self.status_snapshots.fresh()
+            online = fresh["snapshot"]["online"] if fresh is not None else self.check_mc_server(cache_ttl=0)["online"]
+            return online == (target == "MC_SERVER_UP"), "MC_SERVER_UP" if online else "MC_SERVER_DOWN"
+        if target in ("TASK_RUNNING", "TASK_STOPPED"):
+            # One refreshed task snapshot per poll
+            task_status = self.tec_fargate.check_task_status(self.task_tags, refresh=True)
+            reached = task_status == "RUNNING" if target == "TASK_RUNNING" else task_status is None
+            return reached, task_status or "STOPPED"
+        job = self.jobs.get(int(job_id))
+        state = job["state"] if job is not None else None
+        return state in (JobStore.DONE, JobStore.FAILED, None), state
+
+    def conditional_response(self, response):
+        """
+        Return the response with an ETag, or an empty 304 if the client already has this status.
+        """
+        stable_fields = {key: value for key, value in response.items() if key not in VOLATILE_RESPONSE_FIELDS}
+        digest = hashlib.sha256(json.dumps(stable_fields, sort_keys=True, cls=DateTimeEncoder).encode()).hexdigest()
+        etag = f'W/"{digest[:16]}"'
+        if self.IF_NONE_MATCH and etag in [tag.strip() for tag in self.IF_NONE_MATCH.split(",")]:
+            return { "statusCode": 304, "headers": { "ETag": etag } }
+        return {
+            "statusCode": 200,
+            "headers": { "ETag": etag },
+            "body": json.dumps(response, cls=DateTimeEncoder)
+        }
 
     def handle_status(self):
-        if self.is_task_running:
-            task_status = self.tec_fargate.check_task_status(self.task_tags)
+        fresh = self.facts.get("status_snapshot")
+        if fresh is not None:
+            response = self.snapshot_status(fresh["snapshot"], fresh["prev_command"])
         else:
-            if self.mc_server_status["online"]:
+            # The snapshot is stale or the TEC is busy, probe everything live
+            self.facts.prefetch()
+            response = self.live_status()
+
+        if self.JOB_ID is not None:
+            response["JOB"] = self.jobs.get(int(self.JOB_ID))
+        return response
+
+    def snapshot_status(self, snapshot, prev_command):
+        return {
+            'STATUS': "MC_SERVER_UP" if snapshot["online"] else "MC_SERVER_DOWN",
+            'COMMAND': prev_command,
+            "INFO": "RETRIEVED MINECRAFT SERVER STATUS FROM SNAPSHOT",
+            "PLAYERS_ONLINE": snapshot["players_online"],
+            "SNAPSHOT": { "seq": snapshot["seq"], "timestamp": snapshot["timestamp"], "age": snapshot["age"], "timer_status": snapshot["timer_status"] }
+        }
+
+    def live_status(self):
+        info = "RETRIEVED MINECRAFT SERVER STATUS"
+        if self.facts.get("is_task_running"):
+            task_status = self.facts.get("task_status")
+        elif self.facts.get("pending_jobs"):
+            # The TEC that deferred these jobs exited without running them
+            job = self.dispatch_pending_job(self.facts.get("pending_jobs")[0])
+            task_status = job["task_status"]
+            info = f"DISPATCHED PENDING JOB {job['id']}" if job["state"] == JobStore.DISPATCHED else f"PENDING JOB {job['id']} WAITING FOR TEC"
+        else:
+            if self.facts.get("mc_server_status")["online"]:
                 task_status = "MC_SERVER_UP"
             else:
                 task_status = "MC_SERVER_DOWN"
 
-        prev_command = self.ssm.get_param(self.envs["BOT_COMMAND_NAME"])
-        return { 'STATUS': task_status, 'COMMAND': prev_command, "INFO": "RETRIEVED MINECRAFT SERVER STATUS"}
+        prev_command = self.facts.get("prev_command")
+        return { 'STATUS': task_status, 'COMMAND': prev_command, "INFO": info}
 
-    def handle_mc_world_archive(self):
+    def dispatch_pending_job(self, job):
         """
-        Handle Minecraft world archive tasks. Wait for any running task to finish, then launch a new Fargate task.
+        Launch a new Fargate task for a pending job and mark the job as dispatched. If another launch is
+        in flight the job stays pending, that task runs it when it completes its own job.
         """
-        task_name = "MC_WORLD_ARCHIVE"
-        # If a task is currently running, wait for it to finish up to a time limit
-        if self.is_task_running:
-            check_interval = 60
-            time_limit = 600
-            start_time = time.time()
-            self.logger.info(f"waiting for {seconds_to_minutes(time_limit)} minutes")
+        launch = self.launch_new_fargate_task(job["action"], job["id"])
+        if launch["coalesced"]:
+            return {**job, "task_status": launch["task_status"]}
+        return self.jobs.update(job["id"], JobStore.DISPATCHED, task_arn=launch["task_arn"], task_status=launch["task_status"])
 
-            while (time.time() - start_time) < time_limit:
-                self.is_task_running = self.tec_fargate.is_task_with_tags_exists(self.task_tags)
-                if not self.is_task_running:
-                    task_arn, task_status = self.launch_new_fargate_task()
-                    return { "STATUS": task_name, "INFO": f"New Fargate task launched: {task_arn} | {task_status}" }
+    def handle_mc_world_archive(self):
+        """
+        Handle Minecraft world archive tasks. The archive is queued, so if a TEC is running it runs when the
+        commands ahead of it complete. Otherwise a new Fargate task is launched for it.
+        """
+        return self.submit_command("MC_WORLD_ARCHIVE TASK LAUNCHED", queued_status="MC_WORLD_ARCHIVE_PENDING")
+    
+    def handle_status_snapshot(self):
+        """
+        Store the status snapshot published by the monitoring sidecar.
+        """
+        record = self.status_snapshots.publish(self.SNAPSHOT)
+        return { "STATUS": "SNAPSHOT_STORED", "COMMAND": self.ACTION, "INFO": f"STORED STATUS SNAPSHOT {record['seq']}" }
 
-                time.sleep(check_interval)
-                elapsed = time.time() - start_time
-                self.logger.info(f"time elapsed: {int(elapsed)} seconds")
+    def emit_metrics(self, tracer, response):
+        """
+        Emit the invocation's phase durations and AWS call counts as one EMF record.
+        """
+        ssm_calls = self.ssm.store.calls - self.ssm_calls_at_start
+        counts = { "ecs_calls": self.tec_fargate.get_api_call_count(), "ssm_calls": sum(ssm_calls.values()) }
+        return tracer.emit(self.envs["METRICS_NAMESPACE"], { "Action": self.ACTION }, counts, {
+            "status_code": response["statusCode"],
+            "server_id": self.SERVER_ID,
+            "cold_start": self.invocation["cold_start"],
+            "aws_calls": { "ecs": dict(self.tec_fargate.api_calls), "ssm": dict(ssm_calls) }
+        })
 
-            self.logger.warning(f"Fargate task still running after {seconds_to_minutes(elapsed)} minutes.")
-            return { "STATUS": f"MC_WORLD_ARCHIVE_FAILED_START", "INFO": f"Timed out" }
-        
-        # If no task is running, directly launch a new one
-        self.launch_new_fargate_task()
-        return { "STATUS": task_name, 'COMMAND': self.ACTION, "INFO": f"New Fargate task launched: {task_arn} | {task_status}" }
-    
     def handle_ping(self):
         self.logger.info("Testing Lambda with PING - PONG")
         return { "STATUS": "PONG", "COMMAND": self.ACTION, "INFO": "Testing Lambda with PING - PONG" }
@@ -165,6 +435,24 @@ class LambdaHandler:
 
 # Where the magic happens
 def lambda_handler(event, context):
-    handler = LambdaHandler(event)
-    return handler.execute_command()
+    tracer = start_trace()
+    try:
+        with tracer.span("handler.init"):
+            handler = LambdaHandler(event, get_runtime_context(INIT_START))
+    except AuthorizationError as error:
+        get_runtime_context().logger.warning("Unauthorized request", extra={"error": str(error)})
+        return {
+            "statusCode": 401,
+            "body": json.dumps({"error": str(error)}, cls=DateTimeEncoder)
+        }
+    except ValueError as error:
+        # The request itself is invalid, e.g. no action or an unknown server_id
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": str(error)}, cls=DateTimeEncoder)
+        }
+    with tracer.span("handler.execute"):
+        response = handler.execute_command()
+    handler.emit_metrics(tracer, response)
+    return response
 
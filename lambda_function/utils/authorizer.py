@@ -1,41 +1,96 @@
-import boto3
+import hmac
+import json
+import threading
+import time
+from typing import Dict, Any, Tuple
 from .logger import setup_logging
 from .ssm import SSMUtil
 
 class AuthorizationError(Exception):
     pass
 
+# Keyrings shared by warm invocations: {ssm_param_name: {"tokens", "expires_at", "refreshed_at"}}
+_keyrings: Dict[str, Dict[str, Any]] = {}
+_keyrings_lock = threading.Lock()
+
 class Authorization:
-    def __init__(self, ssm_param_name):
+    """
+    Checks the request's bearer token against a keyring of valid tokens kept in SSM.
+
+    The keyring is a JSON list or comma/newline separated tokens, so a new token can be added next to
+    the old one while clients rotate. It is cached for `ttl` seconds across warm invocations and reloaded
+    early when a token doesn't match, at most once per `min_refresh_interval` seconds.
+    """
+    def __init__(self, ssm_param_name, ssm=None, ttl: float = 300, min_refresh_interval: float = 10):
         self.logger = setup_logging() # Setting up logging
         self.ssm_param_name = ssm_param_name
-        self.auhorization_token = None
-        self._load_token_from_ssm()
+        self.ssm = ssm or SSMUtil()
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
 
-    def _load_token_from_ssm(self):
+    def check(self, event) -> bool:
         """
-        Load the token from SSM Parameter Store. If loading fails, the token remains None.
+        Checks for the presence and correctness of an authorization token.
         """
-        try:
-            self.auhorization_token = SSMUtil.get_param(self.ssm_param_name)
-            self.logger.info("Successfully loaded token from SSM.")
-        except Exception as e:
-            self.logger.error(f"Error loading token from SSM: {e}")
-            raise AuthorizationError("Failed to load authorization token.")
+        token = self._get_bearer_token(event)
+        if self._matches(token, self._get_keyring()):
+            return True
+
+        # The token may have been added to the keyring since it was cached
+        if self._can_refresh() and self._matches(token, self._get_keyring(refresh=True)):
+            return True
+        raise AuthorizationError("Invalid authorization token provided.")
 
-    def check(self, event):
+    def _get_bearer_token(self, event) -> str:
+        headers = event.get('headers') or {}
+        auth_header = next((value for key, value in headers.items() if key.lower() == 'authorization'), None)
+        if not auth_header:
+            raise AuthorizationError("Authorization header missing in the event.")
+        return auth_header.replace("Bearer ", "", 1).strip()
+
+    def _matches(self, token: str, tokens: Tuple[str, ...]) -> bool:
         """
-        Checks for the presence and correctness of an authorization token.
+        Compare against every token in constant time, so neither the position of a match nor
+        the length of a matching prefix shows in the response time.
         """
-        if not self.auhorization_token:
-            raise AuthorizationError("Token not loaded. Denying access.")
+        matched = False
+        for valid_token in tokens:
+            matched |= hmac.compare_digest(token.encode(), valid_token.encode())
+        return matched
+
+    def _get_keyring(self, refresh: bool = False) -> Tuple[str, ...]:
+        with _keyrings_lock:
+            keyring = _keyrings.get(self.ssm_param_name)
+            if keyring is not None and not refresh and keyring["expires_at"] > time.monotonic():
+                return keyring["tokens"]
+
+            tokens = self._load_keyring()
+            now = time.monotonic()
+            _keyrings[self.ssm_param_name] = { "tokens": tokens, "expires_at": now + self.ttl, "refreshed_at": now }
+            return tokens
+
+    def _can_refresh(self) -> bool:
+        keyring = _keyrings.get(self.ssm_param_name)
+        return keyring is None or time.monotonic() - keyring["refreshed_at"] >= self.min_refresh_interval
 
+    def _load_keyring(self) -> Tuple[str, ...]:
+        """
+        Load the keyring from SSM Parameter Store.
+        """
         try:
-            auth_header = event['headers'].get('Authorization', '').replace("Bearer ", "")
-            if auth_header != self.auhorization_token:
-                raise AuthorizationError("Invalid authorization token provided.")
-            return True
-        except KeyError:
-            raise AuthorizationError("Authorization header missing in the event.")
+            value = self.ssm.get_param(self.ssm_param_name, max_age=0)
+        except Exception as e:
+            self.logger.error(f"Error loading token from SSM: {e}")
+            raise AuthorizationError("Failed to load authorization token.")
 
+        try:
+            parsed = json.loads(value)
+        except json.JSONDecodeError:
+            parsed = None
+        tokens = parsed if isinstance(parsed, list) else value.replace("\n", ",").split(",")
+        tokens = tuple(token.strip() for token in tokens if isinstance(token, str) and token.strip())
+        if not tokens:
+            raise AuthorizationError("Token not loaded. Denying access.")
 
+        self.logger.info(f"Successfully loaded {len(tokens)} tokens from SSM.")
+        return tokens
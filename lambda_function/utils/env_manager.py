@@ -2,11 +2,13 @@ import os
 import json
 from typing import Dict, Any, List
 from .logger import setup_logging
+from .metrics import span
 
 class EnvironmentVariables:
     def __init__(self, action) -> None:
         self.logger = setup_logging() # Setting up logging
         self.REQUIRED_VARS = self.get_required_vars()
+        self.OPTIONAL_VARS = self.get_optional_vars()
         self.configured = self.check_configuration()
         self.env_vars: Dict[str, Any] = {}
         self.action = action
@@ -33,6 +35,43 @@ class EnvironmentVariables:
                             ]
         return required_configs
 
+    def get_optional_vars(self):
+        optional_configs = {
+                                # Minecraft status probe
+                                'MC_STATUS_CACHE_TTL': '5', # Seconds a probe result is reused by warm invocations
+                                'MC_CONNECT_TIMEOUT': '1', # Seconds to wait for the server's port to accept a connection
+
+                                # SSM Parameter Store
+                                'SSM_CACHE_TTL': '30', # Seconds a parameter value is reused by warm invocations
+                                'SSM_BACKEND': 'aws', # 'local' swaps SSM for an in-memory stand-in
+
+                                # Launch guard
+                                'LAUNCH_LOCK_TTL': '1800', # Seconds before an unreleased launch lock is considered stale
+
+                                # Job queue
+                                'JOB_DISPATCH_TIMEOUT': '900', # Seconds a launched task has to start its job before the job is failed
+                                'JOB_HEARTBEAT_TIMEOUT': '300', # Seconds without a heartbeat from the task before its running job is failed
+
+                                # Status snapshots published by the monitoring sidecar
+                                'STATUS_SNAPSHOT_MAX_AGE': '150', # Seconds a snapshot is served before status is probed live
+
+                                # Long-poll requests
+                                'WAIT_FOR_MAX_SECONDS': '25', # Upper bound of a held request, under API Gateway's 29 second timeout
+
+                                # Observability
+                                'METRICS_NAMESPACE': 'MinecraftServer/Lambda', # CloudWatch namespace of the per-invocation metrics
+                                'LOG_ENV_VARS': 'false', # 'true' logs every variable once per execution environment
+
+                                # API authorization
+                                'AUTH_TOKEN_NAME': '', # SSM parameter holding the bearer token keyring, requests aren't authorized when unset
+                                'AUTH_TOKEN_TTL': '300', # Seconds the keyring is reused by warm invocations
+
+                                # Servers run from this API
+                                'SERVER_REGISTRY_NAME': '', # SSM parameter holding the server registry, takes precedence over SERVER_REGISTRY_JSON
+                                'SERVER_REGISTRY_JSON': '{}', # {server_id: {ENV_VAR: value}}
+                            }
+        return optional_configs
+
     def check_configuration(self):
         # Check for required configurations
         missing_configs = []
@@ -50,10 +89,13 @@ class EnvironmentVariables:
         """
         Fetches and decodes the environment variables. Returns the fetched variables.
         """
-        self._fetch_required_variables()
-        self._decode_tags_json()
-        self._verify_missing_variables()
-        self._log_env_variables()
+        with span("env.load"):
+            self._fetch_required_variables()
+            self._fetch_optional_variables()
+            self._decode_tags_json()
+            self._verify_missing_variables()
+        if self.env_vars["LOG_ENV_VARS"].lower() == "true":
+            self._log_env_variables()
 
         return self.env_vars
         
@@ -63,6 +105,12 @@ class EnvironmentVariables:
         """
         self.env_vars.update({var: os.getenv(var) for var in self.REQUIRED_VARS})
 
+    def _fetch_optional_variables(self) -> None:
+        """
+        Fetches optional environment variables, falling back to their defaults.
+        """
+        self.env_vars.update({var: os.getenv(var, default) for var, default in self.OPTIONAL_VARS.items()})
+
     def _decode_tags_json(self) -> None:
         """
         Decodes the TAGS_JSON environment variable and updates env_vars.
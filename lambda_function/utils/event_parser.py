@@ -2,12 +2,14 @@ import json
 from .logger import setup_logging
 from .helper import format_dictionary
 from .authorizer import Authorization
+from .metrics import span
 
 class APIEventParser:
     def __init__(self, event):
         self.logger = setup_logging() # Setting up logging
-        self.body = self._parse_body(event)
-        self.header = self._parse_headers(event)
+        with span("event.parse"):
+            self.body = self._parse_body(event)
+            self.header = self._parse_headers(event)
         # self.isAuthorized = Authorization.check("ssm_param_name")
 
         # For debuging later
@@ -20,8 +22,20 @@ class APIEventParser:
 
         return {
             "action": action,
+            "job_id": self.body.get("job_id"), # Optional, reports the progress of a deferred job
+            "server_id": self.body.get("server_id"), # Optional, the server in the registry the action is for
+            "snapshot": self.body.get("snapshot"), # Sent by the monitoring sidecar with the status_snapshot action
+            "if_none_match": self.get_header("If-None-Match"),
+            "wait_for": self.body.get("wait_for"), # Optional, hold the request until this state is reached
+            "wait_timeout": self.body.get("wait_timeout"),
         }
 
+    def get_header(self, name):
+        """
+        Return a header's value, matching its name case-insensitively.
+        """
+        return next((value for key, value in (self.header or {}).items() if key.lower() == name.lower()), None)
+
     def extract_key(self, key):
         """
         Extract a specific key from the body.
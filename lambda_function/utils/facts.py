@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Any, Iterable
+from .logger import setup_logging
+
+class ProbeTimeoutError(Exception):
+    """
+    Raised when a fact could not be resolved before its deadline and has no default.
+    """
+    pass
+
+class FactResolver:
+    """
+    Computes the facts an action declared it needs and memoizes them for the invocation.
+
+    Facts are resolved on first access, or all at once on a thread pool with prefetch(). Each fact
+    can have a deadline (seconds) and a default value that is used if the deadline passes.
+    """
+    def __init__(self, providers: Dict[str, Callable[[], Any]], required: Iterable[str], deadlines: Dict[str, float] = None, defaults: Dict[str, Any] = None):
+        self.logger = setup_logging() # Setting up logging
+        self.providers = providers
+        self.required = set(required)
+        self.deadlines = deadlines or {}
+        self.defaults = defaults or {}
+        self.values: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self.futures = {}
+        self.executor = None
+        self.lock = threading.Lock()
+
+        unknown_facts = self.required - set(self.providers)
+        if unknown_facts:
+            raise ValueError(f"No provider for facts: {', '.join(sorted(unknown_facts))}")
+
+    def prefetch(self, names: Iterable[str] = None) -> None:
+        """
+        Start resolving the named facts, or every declared fact, concurrently.
+        """
+        names = self.required if names is None else self.required & set(names)
+        pending = [name for name in names if name not in self.values and name not in self.futures]
+        if not pending:
+            return
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.required), thread_name_prefix="probe")
+        for name in pending:
+            self.futures[name] = (self.executor.submit(self._resolve, name), time.perf_counter())
+
+    def get(self, name: str) -> Any:
+        """
+        Return the value of a fact, resolving it (or waiting for its prefetch) if needed.
+        """
+        if name not in self.required:
+            raise ValueError(f"Fact '{name}' was not declared for this action")
+
+        if name not in self.values:
+            if name in self.futures:
+                self.values[name] = self._wait(name)
+            else:
+                self.values[name] = self._resolve(name)
+            self.logger.debug(f"Resolved fact '{name}': {self.values[name]}")
+        return self.values[name]
+
+    def _wait(self, name: str) -> Any:
+        future, submitted_at = self.futures[name]
+        deadline = self.deadlines.get(name)
+        timeout = None if deadline is None else max(0, deadline - (time.perf_counter() - submitted_at))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._record(name, submitted_at, "timeout")
+            if name in self.defaults:
+                self.logger.warning(f"Probe '{name}' missed its {deadline}s deadline, using its default.")
+                return self.defaults[name]
+            raise ProbeTimeoutError(f"Probe '{name}' missed its {deadline}s deadline")
+
+    def _resolve(self, name: str) -> Any:
+        start = time.perf_counter()
+        try:
+            value = self.providers[name]()
+        except Exception:
+            self._record(name, start, "error")
+            raise
+        self._record(name, start, "ok")
+        return value
+
+    def _record(self, name: str, start: float, status: str) -> None:
+        with self.lock:
+            # The first outcome wins, a probe finishing after its deadline stays a timeout
+            if name not in self.timings:
+                self.timings[name] = {"status": status, "ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    def close(self) -> None:
+        """
+        Cancel the probes that are still pending. Running probes are left to finish in the background.
+        """
+        for name, (future, submitted_at) in self.futures.items():
+            if future.cancel():
+                self._record(name, submitted_at, "cancelled")
+            elif not future.done():
+                self._record(name, submitted_at, "abandoned")
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def invalidate(self, name: str) -> None:
+        """
+        Forget a memoized fact so the next access resolves it again.
+        """
+        self.values.pop(name, None)
+        self.futures.pop(name, None)
+
+    def resolved(self) -> Dict[str, Any]:
+        return dict(self.values)
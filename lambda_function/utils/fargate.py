@@ -1,89 +1,202 @@
 import boto3
+import threading
+from collections import Counter
 from .env_manager import EnvironmentVariables
 from .logger import setup_logging
+from .metrics import span
+from .registry import DEFAULT_SERVER_ID
+
+class TaskSnapshot:
+    """
+    Point-in-time view of the tasks in an ECS cluster, with each task's tags indexed by key and an
+    index of (tag key, tag value) -> task ARNs, so a lookup only visits the tasks that can match.
+    """
+    ANY_VALUE_TAGS = ('TAG_RUNNING_COMMAND',) # Any running command counts as a match, only the tag's presence matters
+
+    def __init__(self, tasks):
+        self.tasks = {}
+        self.tags = {}
+        self.index = {}
+        for task in tasks:
+            self.add(task)
+
+    def add(self, task):
+        task_arn = task["taskArn"]
+        task_tags = {tag['key']: tag.get('value') for tag in task.get('tags', [])}
+        # Tasks launched before servers were tagged belong to the default server
+        task_tags.setdefault('TAG_SERVER_ID', DEFAULT_SERVER_ID)
+        self.tasks[task_arn] = task
+        self.tags[task_arn] = task_tags
+        for key, value in task_tags.items():
+            self.index.setdefault((key, value), []).append(task_arn)
+
+    def find(self, desired_tags):
+        """
+        Return the first task whose tags match the desired tags, or None.
+        """
+        exact_tags = [(tag['key'], tag['value']) for tag in desired_tags if tag['key'] not in self.ANY_VALUE_TAGS]
+        # Only the tasks carrying the rarest desired tag are checked
+        candidates = min((self.index.get(tag, []) for tag in exact_tags), key=len) if exact_tags else self.tags
+        for task_arn in candidates:
+            if self._tags_match(self.tags[task_arn], desired_tags):
+                return self.tasks[task_arn]
+        return None
+
+    @classmethod
+    def _tags_match(cls, task_tags, desired_tags):
+        for tag_to_check in desired_tags:
+            if tag_to_check['key'] not in task_tags:
+                return False
+            if tag_to_check['key'] not in cls.ANY_VALUE_TAGS and task_tags[tag_to_check['key']] != tag_to_check['value']:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self.tasks)
 
 class Fargate:
-    def __init__(self, cluster, env_vars):
+    DESCRIBE_TASKS_BATCH_SIZE = 100 # Max number of task ARNs ECS accepts per describe_tasks call
+
+    def __init__(self, cluster, env_vars, desired_statuses=("RUNNING",), client=None):
         self.logger = setup_logging() # Setting up logging
         self.cluster = cluster
-        self.client = boto3.client('ecs')
+        self.client = client or boto3.client('ecs')
         self.env_vars = env_vars
         self.cluster = self.env_vars["CLUSTER"]
         self.task_definition = self.env_vars["TASK_DEFINITION_NAME"]
         self.container_name = self.env_vars["CONTAINER_NAME"]
         self.environment_variables = self.set_env_vars()
         self.network_configuration = self.set_network_config()
-        self.tags = self.set_task_tags()      
+        self.tags = self.set_task_tags()
+        self.desired_statuses = desired_statuses
+        # ECS lists tasks by startedBy, so a server's lookups don't scan the other servers' tasks
+        self.started_by = f"mc-tec/{self.env_vars.get('SERVER_ID', DEFAULT_SERVER_ID)}"
+        # Tasks launched before startedBy was set have none and belong to the default server, so its
+        # lookups list the whole cluster and keep the tasks started by it or by nobody
+        self.include_unlabelled = self.env_vars.get('SERVER_ID', DEFAULT_SERVER_ID) == DEFAULT_SERVER_ID
+        self.api_calls = Counter() # Number of ECS calls made, by operation
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock() # Concurrent probes share one snapshot build
+
+    def create_fargate_container(self, running_command=None, extra_environment=None):
+        """
+        Run a new TEC task. running_command overrides the task's TAG_RUNNING_COMMAND tag and
+        extra_environment ({name: value}) is added to the container's environment variables.
+        """
+        tags = self.tags
+        if running_command is not None:
+            tags = [{**tag, 'value': running_command} if tag['key'] == 'TAG_RUNNING_COMMAND' else tag for tag in self.tags]
+        environment_variables = self.environment_variables
+        if extra_environment:
+            environment_variables = environment_variables + [{'name': name, 'value': str(value)} for name, value in extra_environment.items()]
 
-    def create_fargate_container(self):
         try:
-            response = self.client.run_task(
-                cluster=self.cluster,
-                launchType="FARGATE",
-                taskDefinition=self.task_definition,
-                count=1,
-                platformVersion="LATEST",
-                networkConfiguration=self.network_configuration,
-                overrides={
-                    "containerOverrides": [{
-                        "name": self.container_name,
-                        "environment": self.environment_variables
-                    }]
-                },
-                tags=self.tags
-            )
-            task_arn = response["tasks"][0]["taskArn"]
+            with span("ecs.run_task"):
+                response = self.client.run_task(
+                    cluster=self.cluster,
+                    launchType="FARGATE",
+                    taskDefinition=self.task_definition,
+                    count=1,
+                    startedBy=self.started_by,
+                    platformVersion="LATEST",
+                    networkConfiguration=self.network_configuration,
+                    overrides={
+                        "containerOverrides": [{
+                            "name": self.container_name,
+                            "environment": environment_variables
+                        }]
+                    },
+                    tags=tags
+                )
+            self.api_calls["run_task"] += 1
+            task = response["tasks"][0]
+            task_arn = task["taskArn"]
+
+            # Add the new task to the snapshot so the status lookup doesn't need another scan
+            if self.snapshot is not None:
+                self.snapshot.add({**task, "tags": task.get("tags") or tags})
             self.logger.debug(f"Created Fargate container with ARN: '{task_arn}'")
             return task_arn
         except Exception as e:
             self.logger.error(f"Error creating Fargate container: {e}")
             raise
 
-    def is_task_with_tags_exists(self, desired_tags):
+    def get_task_snapshot(self, refresh=False):
+        """
+        Return the cluster's task snapshot, building it on first use or when a refresh is requested.
+        """
+        with self.snapshot_lock:
+            if self.snapshot is None or refresh:
+                with span("ecs.task_snapshot"):
+                    self.snapshot = self._build_task_snapshot()
+            return self.snapshot
+
+    def _build_task_snapshot(self):
+        """
+        Page through list_tasks for each desired status and describe the tasks in batches. Only the tasks
+        started for this server are kept, plus those without startedBy for the default server.
+        """
         try:
-            tasks_response = self.client.list_tasks(cluster=self.cluster)
-            for task_arn in tasks_response.get('taskArns'):
-                current_task_details = self.client.describe_tasks(
+            task_arns = {} # dict keeps the listing order while dropping duplicate ARNs
+            paginator = self.client.get_paginator('list_tasks')
+            list_filter = {} if self.include_unlabelled else {"startedBy": self.started_by}
+            for desired_status in self.desired_statuses:
+                for page in paginator.paginate(cluster=self.cluster, desiredStatus=desired_status, **list_filter):
+                    self.api_calls["list_tasks"] += 1
+                    task_arns.update(dict.fromkeys(page.get('taskArns', [])))
+            task_arns = list(task_arns)
+
+            tasks = []
+            for i in range(0, len(task_arns), self.DESCRIBE_TASKS_BATCH_SIZE):
+                response = self.client.describe_tasks(
                     cluster=self.cluster,
-                    tasks=[task_arn],
+                    tasks=task_arns[i:i + self.DESCRIBE_TASKS_BATCH_SIZE],
                     include=['TAGS'],
                 )
-                for task_data in current_task_details.get('tasks'):
-                    if self._tags_match(task_data.get('tags', []), desired_tags):
-                        self.logger.info(f"Located task with ARN '{task_arn}' matching the specified tags.")
-                        return True
-            self.logger.info(f"No tasks matching the provided tags were found in cluster '{self.cluster}'.")
-            return False
-        except Exception as e:
-            self.logger.error(f"Error checking if task with tags exists: {e}")
-            raise
+                self.api_calls["describe_tasks"] += 1
+                tasks.extend(task for task in response.get('tasks', []) if task.get('startedBy') in (self.started_by, None))
 
-    def check_task_status(self, tags):
-        try:
-            list_tasks_response = self.client.list_tasks(cluster=self.cluster)
-            for task_arn in list_tasks_response.get("taskArns", []):
-                describe_task_response = self.client.describe_tasks(cluster=self.cluster, tasks=[task_arn], include=['TAGS'])
-                task = describe_task_response["tasks"][0]
-                if self._tags_match(task.get('tags', []), tags):
-                    self.logger.debug(f"Task Status: {task['lastStatus']}")
-                    return task["lastStatus"]
-            self.logger.info(f"No tasks matched the provided tags: {tags}.")
-            return None
+            self.logger.info(f"Task snapshot of cluster '{self.cluster}': {len(tasks)} tasks using {self.get_api_call_count()} ECS calls.")
+            return TaskSnapshot(tasks)
         except Exception as e:
-            self.logger.warning(f"Error checking task status: {e}")
+            self.logger.error(f"Error building task snapshot: {e}")
             raise
 
-    def _tags_match(self, task_tags, desired_tags):
-        tag_match_count = 0
-        for tag_to_check in desired_tags:
-            if tag_to_check['key'] == 'TAG_RUNNING_COMMAND':
-                if any(existing_tag['key'] == tag_to_check['key'] for existing_tag in task_tags):
-                    tag_match_count += 1
-            else:
-                if tag_to_check in task_tags:
-                    tag_match_count += 1
-        return tag_match_count == len(desired_tags)
+    def describe_task(self, task_arn):
+        """
+        Describe a single task by ARN, including stopped ones. Returns None if ECS doesn't know it.
+        """
+        task = self.snapshot.tasks.get(task_arn) if self.snapshot is not None else None
+        if task is not None:
+            return task
+
+        with span("ecs.describe_task"):
+            response = self.client.describe_tasks(cluster=self.cluster, tasks=[task_arn], include=['TAGS'])
+        self.api_calls["describe_tasks"] += 1
+        tasks = response.get('tasks', [])
+        return tasks[0] if tasks else None
+
+    def get_api_call_count(self):
+        """
+        Total number of ECS calls made by this instance.
+        """
+        return sum(self.api_calls.values())
+
+    def is_task_with_tags_exists(self, desired_tags, refresh=False):
+        task = self.get_task_snapshot(refresh).find(desired_tags)
+        if task is not None:
+            self.logger.info(f"Located task with ARN '{task['taskArn']}' matching the specified tags.")
+            return True
+        self.logger.info(f"No tasks matching the provided tags were found in cluster '{self.cluster}'.")
+        return False
 
+    def check_task_status(self, tags, refresh=False):
+        task = self.get_task_snapshot(refresh).find(tags)
+        if task is not None:
+            self.logger.debug(f"Task Status: {task['lastStatus']}")
+            return task["lastStatus"]
+        self.logger.info(f"No tasks matched the provided tags: {tags}.")
+        return None
 
     def set_env_vars(self):
         environment_variables = [ 
@@ -92,6 +205,8 @@ class Fargate:
             {'name': 'EC2_PRIVATE_KEY', 'value': self.env_vars["EC2_PRIVATE_KEY"] },
             {'name': 'BOT_COMMAND_NAME', 'value': self.env_vars["BOT_COMMAND_NAME"] },
             {'name': 'ENVIRONMENT', 'value': self.env_vars["TAG_ENVIRONMENT"] },
+            {'name': 'SERVER_ID', 'value': self.env_vars.get("SERVER_ID", DEFAULT_SERVER_ID) },
+            {'name': 'AUTH_TOKEN_NAME', 'value': self.env_vars.get("AUTH_TOKEN_NAME", "") }, # The TEC and the sidecar call the API with a token from this keyring
             ]
         return environment_variables
         
@@ -0,0 +1,190 @@
+import json
+import random
+import time
+import uuid
+from botocore.exceptions import ClientError
+from typing import Callable, Dict, Any, Optional, Tuple
+from .logger import setup_logging
+from .ssm import SSMUtil, ParameterNotFoundError
+
+LAUNCH_LOCK_PARAM_SUFFIX = "_LAUNCH_LOCK" # The lock lives next to the bot command parameter
+CLOCK_SKEW_MARGIN = 5 # Seconds a lock is considered ours before its expiry, so a late write can't land after it is broken
+
+class LaunchGuard:
+    """
+    Single-flight guard around TEC launches.
+
+    The lock is an SSM parameter created with Overwrite=False, which SSM only accepts if the parameter
+    doesn't exist yet, so exactly one caller wins it. The winner launches the task and records its ARN in
+    the lock. The Fargate task deletes the lock when it exits, and a lock older than its ttl is treated as stale.
+
+    SSM has no conditional write or delete, so releasing or breaking a lock holds the lock's ParameterMutex and
+    checks the owner and version again right before the delete. A lock released and taken again by someone else
+    in the meantime is left alone. A lock without a task is never broken during its first `attach_timeout`
+    seconds, so the winner attaches its task within that time without the mutex.
+    """
+    def __init__(self, ssm: SSMUtil, bot_command_name: str, ttl: int = 1800, attach_timeout: float = 120):
+        self.logger = setup_logging() # Setting up logging
+        self.ssm = ssm
+        self.param_name = bot_command_name + LAUNCH_LOCK_PARAM_SUFFIX
+        self.ttl = ttl
+        self.attach_timeout = attach_timeout
+
+    def acquire(self, action: str, is_alive: Callable[[Dict[str, Any]], bool] = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Try to take the lock for the action. Returns (True, lock) if taken, otherwise (False, lock of the holder).
+
+        :param is_alive: Optional check of the holder's lock, a lock it rejects is treated as stale.
+        """
+        lock = { "owner": uuid.uuid4().hex, "action": action, "task_arn": None, "acquired_at": time.time(), "expires_at": time.time() + self.ttl }
+        holder = None
+        for _ in range(2):
+            try:
+                self.ssm.send_param(json.dumps(lock), "String", self.param_name, overwrite=False)
+                self.logger.info(f"Acquired launch lock for '{action}'")
+                return True, lock
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ParameterAlreadyExists":
+                    raise
+
+            holder, version = self._read_versioned()
+            if holder is not None and holder["expires_at"] > time.time() and ((holder.get("task_arn") is None and self._is_attaching(holder)) or is_alive is None or is_alive(holder)):
+                break
+            # The holder released the lock in the meantime or it expired, try once more
+            if holder is not None:
+                self.break_lock(holder, version)
+
+        self.logger.info(f"Launch lock held by '{holder['action'] if holder else 'unknown'}' ({holder and holder.get('task_arn')})")
+        return False, holder
+
+    def attach_task(self, lock: Dict[str, Any], task_arn: str) -> None:
+        """
+        Record the launched task's ARN in a lock we hold, so duplicate commands can join it.
+        Returns False if the lock was broken in the meantime.
+        """
+        lock["task_arn"] = task_arn
+        if self._is_attaching(lock, CLOCK_SKEW_MARGIN):
+            # Nobody breaks the lock yet, it is still ours
+            self.ssm.send_param(json.dumps(lock), "String", self.param_name)
+            return True
+        with ParameterMutex(self.ssm, self.param_name):
+            current, _ = self._read_versioned()
+            if current is None or current["owner"] != lock["owner"]:
+                self.logger.warning(f"Launch lock for '{lock['action']}' was broken before task {task_arn} was attached")
+                return False
+            self.ssm.send_param(json.dumps(lock), "String", self.param_name)
+        return True
+
+    def _is_attaching(self, lock: Dict[str, Any], margin: float = 0) -> bool:
+        """
+        Whether the lock is within the time its winner has to attach the launched task.
+        """
+        return time.time() < lock["acquired_at"] + self.attach_timeout - margin
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        return self._read_versioned()[0]
+
+    def _read_versioned(self) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        try:
+            value, version = self.ssm.get_param_version(self.param_name)
+        except ParameterNotFoundError:
+            return None, None
+        return json.loads(value), version
+
+    def release(self, lock: Dict[str, Any]) -> None:
+        """
+        Release a lock we hold, used when the launch itself failed.
+        """
+        self.break_lock(lock)
+
+    def break_lock(self, lock: Dict[str, Any], version: Optional[int] = None) -> bool:
+        """
+        Delete the lock if it is still owned by the given lock's owner and, when given, still at `version`.
+        """
+        with ParameterMutex(self.ssm, self.param_name):
+            current, current_version = self._read_versioned()
+            if current is None or current["owner"] != lock["owner"] or (version is not None and current_version != version):
+                return False
+            self.logger.warning(f"Removing launch lock for '{lock['action']}' ({lock.get('task_arn')})")
+            return self.ssm.delete_param(self.param_name)
+
+class ParameterMutex:
+    """
+    Short-lived mutual exclusion for read-modify-write updates of an SSM parameter.
+
+    Taken the same way as the launch lock, by creating "<param_name>_MUTEX" with Overwrite=False.
+    Used as a context manager, waiting with jittered exponential backoff up to `timeout` seconds.
+
+    A mutex is only broken once it expired, by a breaker holding the mutex's own ParameterMutex that finds
+    it at the version it saw expire, so a mutex taken again in the meantime is never deleted. The holder
+    deletes its mutex directly while it can't have expired, and through the same check otherwise.
+    """
+    def __init__(self, ssm: SSMUtil, param_name: str, ttl: float = 30, timeout: float = 10, guarded: bool = True):
+        """
+        :param guarded: Break and late release through a ParameterMutex, off for that inner mutex itself.
+        """
+        self.logger = setup_logging() # Setting up logging
+        self.ssm = ssm
+        self.param_name = param_name + "_MUTEX"
+        self.ttl = ttl
+        self.timeout = timeout
+        self.guarded = guarded
+        self.owner = None
+        self.expires_at = None
+
+    def __enter__(self):
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        delay = 0.05
+        while True:
+            expires_at = time.time() + self.ttl
+            try:
+                self.ssm.send_param(json.dumps({ "owner": owner, "expires_at": expires_at }), "String", self.param_name, overwrite=False)
+                self.owner, self.expires_at = owner, expires_at
+                return self
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ParameterAlreadyExists":
+                    raise
+
+            holder, version = self._read()
+            if holder is not None and holder["expires_at"] < time.time():
+                self._delete_if_unchanged(lambda current, current_version: current_version == version, f"Removing expired mutex '{self.param_name}'")
+                continue
+
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for '{self.param_name}'")
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, 1)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if time.time() < self.expires_at - CLOCK_SKEW_MARGIN:
+            # Nobody breaks a mutex before it expires, it is still ours
+            self.ssm.delete_param(self.param_name)
+        else:
+            owner = self.owner
+            self._delete_if_unchanged(lambda current, _: current["owner"] == owner, f"Releasing mutex '{self.param_name}' after its expiry")
+        self.owner = self.expires_at = None
+        return False
+
+    def _delete_if_unchanged(self, check, message):
+        """
+        Delete the mutex if check(current mutex, its version) still holds right before the delete.
+        """
+        if not self.guarded:
+            # The inner mutex of a break, held for a few calls: deleted after a plain check
+            current, version = self._read()
+            if current is not None and check(current, version):
+                self.ssm.delete_param(self.param_name)
+            return
+        with ParameterMutex(self.ssm, self.param_name, ttl=10, timeout=self.timeout, guarded=False):
+            current, version = self._read()
+            if current is not None and check(current, version):
+                self.logger.warning(message)
+                self.ssm.delete_param(self.param_name)
+
+    def _read(self):
+        try:
+            value, version = self.ssm.get_param_version(self.param_name)
+        except ParameterNotFoundError:
+            return None, None
+        return json.loads(value), version
@@ -0,0 +1,138 @@
+import json
+import datetime
+from typing import Dict, Any, List, Optional
+from .logger import setup_logging
+from .ssm import SSMUtil, ParameterNotFoundError
+from .guard import ParameterMutex
+
+JOBS_PARAM_SUFFIX = "_JOBS" # The job store lives next to the bot command parameter
+
+class JobStore:
+    """
+    FIFO queue of TEC commands, kept as one JSON document in an SSM parameter that both the Lambda and the
+    Fargate task read. Each job's id is its sequence number in the queue.
+
+    A job goes PENDING -> DISPATCHED (a task was launched for it) -> RUNNING -> DONE/FAILED. The running TEC
+    drains PENDING jobs in order before it exits. Updates hold a ParameterMutex so concurrent writers don't
+    overwrite each other.
+
+    A task that dies leaves its job behind, so a job is stuck when it was dispatched more than `dispatch_timeout`
+    seconds ago and never started, or when it is running and the task's heartbeat is older than
+    `heartbeat_timeout` seconds. Stuck jobs are marked FAILED on the next write and ignored until then.
+    """
+    PENDING = "PENDING"
+    DISPATCHED = "DISPATCHED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    ACTIVE_STATES = (PENDING, DISPATCHED, RUNNING) # Jobs that aren't finished
+    MAX_FINISHED_JOBS = 10 # Finished jobs kept for status queries
+    MAX_DOCUMENT_BYTES = 4000 # A standard parameter value is limited to 4096 bytes, kept with a margin
+    MAX_ERROR_LENGTH = 200 # Longer job errors are truncated so a few of them can't fill the document
+
+    def __init__(self, ssm: SSMUtil, bot_command_name: str, dispatch_timeout: float = 900, heartbeat_timeout: float = 300):
+        self.logger = setup_logging() # Setting up logging
+        self.ssm = ssm
+        self.param_name = bot_command_name + JOBS_PARAM_SUFFIX
+        self.dispatch_timeout = dispatch_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+
+    def enqueue(self, action: str) -> Dict[str, Any]:
+        """
+        Append a command to the queue and return its job. A command identical to the last job that isn't
+        finished (pending, dispatched or running) is deduplicated into it, so repeated requests don't queue
+        the same work twice. A command differing from it is queued, so "start", "stop", "start" runs all three.
+        """
+        with ParameterMutex(self.ssm, self.param_name):
+            document = self._load()
+            expired = self._expire_stuck(document)
+            active = [job for job in document["jobs"] if job["state"] in self.ACTIVE_STATES]
+            if active and active[-1]["action"] == action:
+                if expired:
+                    self._save(document)
+                self.logger.info(f"'{action}' is already {active[-1]['state'].lower()} as job {active[-1]['id']}")
+                return {**active[-1], "deduplicated": True}
+            pending = [job for job in active if job["state"] == self.PENDING]
+
+            now = self._now()
+            job = { "id": document["next_id"], "action": action, "state": self.PENDING, "created_at": now, "updated_at": now }
+            document["next_id"] += 1
+            document["jobs"].append(job)
+            self._save(document)
+            self.logger.info(f"Queued job {job['id']} for '{action}' ({len(pending) + 1} pending)")
+            return job
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return next((job for job in self._load()["jobs"] if job["id"] == job_id), None)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """
+        Pending jobs, oldest first.
+        """
+        return [job for job in self._load()["jobs"] if job["state"] == self.PENDING]
+
+    def update(self, job_id: int, state: str, **fields) -> Optional[Dict[str, Any]]:
+        with ParameterMutex(self.ssm, self.param_name):
+            document = self._load()
+            expired = self._expire_stuck(document)
+            for job in document["jobs"]:
+                if job["id"] == job_id:
+                    job.update(state=state, updated_at=self._now(), **fields)
+                    self._save(document)
+                    self.logger.info(f"Job {job_id} is now {state}")
+                    return job
+            if expired:
+                self._save(document)
+        self.logger.warning(f"Job {job_id} not found in '{self.param_name}'")
+        return None
+
+    def is_stuck(self, job: Dict[str, Any]) -> bool:
+        """
+        Whether the task of a dispatched or running job is presumed dead.
+        """
+        if job["state"] == self.DISPATCHED:
+            return self._age(job["updated_at"]) > self.dispatch_timeout
+        if job["state"] == self.RUNNING:
+            return self._age(job.get("heartbeat_at") or job["updated_at"]) > self.heartbeat_timeout
+        return False
+
+    def _expire_stuck(self, document: Dict[str, Any]) -> int:
+        """
+        Mark the stuck jobs of the document as failed and return how many there were.
+        """
+        stuck = [job for job in document["jobs"] if self.is_stuck(job)]
+        for job in stuck:
+            self.logger.warning(f"Job {job['id']} ({job['action']}) has been {job['state']} with no sign of its task, marking it as failed")
+            job.update(state=self.FAILED, updated_at=self._now(), error=f"Task stopped responding while the job was {job['state']}")
+        return len(stuck)
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            # Always read the latest value, the Fargate task updates jobs as it runs them
+            return json.loads(self.ssm.get_param(self.param_name, max_age=0))
+        except ParameterNotFoundError:
+            return { "next_id": 1, "jobs": [] }
+
+    def _save(self, document: Dict[str, Any]) -> None:
+        """
+        Write the document, truncating long errors and dropping the oldest finished jobs beyond
+        MAX_FINISHED_JOBS or for as long as the document is over MAX_DOCUMENT_BYTES.
+        """
+        for job in document["jobs"]:
+            if len(job.get("error") or "") > self.MAX_ERROR_LENGTH:
+                job["error"] = job["error"][:self.MAX_ERROR_LENGTH - 3] + "..."
+        finished = [job for job in document["jobs"] if job["state"] in (self.DONE, self.FAILED)]
+        for job in finished[:-self.MAX_FINISHED_JOBS]:
+            document["jobs"].remove(job)
+            finished.remove(job)
+        value = json.dumps(document, separators=(",", ":"))
+        while len(value.encode()) > self.MAX_DOCUMENT_BYTES and finished:
+            document["jobs"].remove(finished.pop(0))
+            value = json.dumps(document, separators=(",", ":"))
+        self.ssm.send_param(value, "String", self.param_name)
+
+    def _now(self) -> str:
+        return datetime.datetime.utcnow().isoformat(timespec="seconds")
+
+    def _age(self, timestamp: str) -> float:
+        return (datetime.datetime.utcnow() - datetime.datetime.fromisoformat(timestamp)).total_seconds()
@@ -1,13 +1,20 @@
 import logging
 import os
 
+_logger = None
+
 def setup_logging():
     """
-    Setup logging configuration.
+    Setup logging configuration. The logger is configured once per execution environment and reused afterwards.
     """
+    global _logger
+    if _logger is not None:
+        return _logger
+
     # Get the root logger
     logger = logging.getLogger()
-    log_level = logger.setLevel(logging.INFO)  # or whichever level you desire
+    log_level = logging.INFO  # or whichever level you desire
+    logger.setLevel(log_level)
 
     # Ensure there is no duplicated handlers
     if not logger.handlers:
@@ -27,4 +34,5 @@ def setup_logging():
     # file_handler.setFormatter(logging.Formatter(log_format))
     # logging.getLogger().addHandler(file_handler)
 
-    return logging.getLogger()
+    _logger = logging.getLogger()
+    return _logger
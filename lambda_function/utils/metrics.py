@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+
+class Tracer:
+    """
+    Times the phases of one invocation. A phase can run several times or on several threads,
+    its durations are summed and counted.
+    """
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, Dict[str, float]] = {} # name -> {"ms", "count"}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name: str, ms: float) -> None:
+        with self.lock:
+            phase = self.phases.setdefault(name, {"ms": 0.0, "count": 0})
+            phase["ms"] += ms
+            phase["count"] += 1
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def to_emf(self, namespace: str, dimensions: Dict[str, str], counts: Dict[str, int], properties: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Build a CloudWatch Embedded Metric Format record: one millisecond metric per phase and
+        one count metric per counter, all under the given dimensions.
+        """
+        with self.lock:
+            durations = {name: round(phase["ms"], 3) for name, phase in self.phases.items()}
+            phase_counts = {name: phase["count"] for name, phase in self.phases.items()}
+        durations["invocation"] = round(self.elapsed_ms(), 3)
+
+        metrics = [{"Name": name, "Unit": "Milliseconds"} for name in durations]
+        metrics += [{"Name": name, "Unit": "Count"} for name in counts]
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{ "Namespace": namespace, "Dimensions": [list(dimensions)], "Metrics": metrics }]
+            },
+            **dimensions,
+            **durations,
+            **counts,
+            "phase_counts": phase_counts,
+            **(properties or {})
+        }
+
+    def emit(self, namespace: str, dimensions: Dict[str, str], counts: Dict[str, int], properties: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Print the invocation's EMF record on its own line, where CloudWatch Logs extracts the metrics from.
+        """
+        record = self.to_emf(namespace, dimensions, counts, properties)
+        print(json.dumps(record, separators=(",", ":"), default=str), flush=True)
+        return record
+
+# The invocation being traced. Lambda runs one invocation at a time per execution environment.
+_tracer = Tracer()
+
+def start_trace() -> Tracer:
+    """
+    Start tracing a new invocation and return its tracer.
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+def span(name: str):
+    """
+    Time a phase of the current invocation: `with span("ecs.run_task"): ...`
+    """
+    return _tracer.span(name)
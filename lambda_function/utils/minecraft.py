@@ -1,28 +1,83 @@
-from mcstatus import JavaServer
+import socket
+import time
+from mcstatus.address import Address
+from mcstatus.pinger import ServerPinger
+from mcstatus.protocol.connection import SocketConnection, TCPSocketConnection
 from typing import Dict, Any
 from .logger import setup_logging
+from .metrics import span
+
+# Probe results shared by warm invocations, keyed by server address: {address: (expires_at, result)}
+_status_cache: Dict[Address, Any] = {}
+
+class StatusConnection(TCPSocketConnection):
+    """
+    TCP connection with separate connect and read timeouts, so an address nothing listens on fails fast.
+    """
+    __slots__ = ()
+
+    def __init__(self, addr: Address, connect_timeout: float, read_timeout: float):
+        SocketConnection.__init__(self)
+        self.socket = socket.create_connection(addr, timeout=connect_timeout)
+        self.socket.settimeout(read_timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
 class MinecraftServer:
-    def __init__(self, ip: str, port: str):
+    def __init__(self, ip: str, port: str, cache_ttl: float = 5, connect_timeout: float = 1, read_timeout: float = 2):
         self.logger = setup_logging()
         self.server_address = f"{ip}:{port}"
-        self.java_server = JavaServer.lookup(self.server_address)
+        # The server is addressed by IP, so the DNS/SRV lookup done by JavaServer.lookup is skipped
+        self.address = Address(ip, int(port))
+        self.cache_ttl = cache_ttl
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
 
     def check(self) -> Dict[str, Any]:
         """
-        Checks the status of the Minecraft server.
+        Checks the status of the Minecraft server. Results are cached for cache_ttl seconds, 0 always probes.
+        """
+        cached = _status_cache.get(self.address)
+        if cached is not None and self.cache_ttl > 0 and cached[0] > time.monotonic():
+            return {**cached[1], 'cached': True}
+
+        with span("minecraft.probe"):
+            result = self._probe()
+        _status_cache[self.address] = (time.monotonic() + self.cache_ttl, result)
+        return {**result, 'cached': False}
+
+    def _probe(self) -> Dict[str, Any]:
         """
+        Get the server's status with one handshake and one status exchange on a single connection.
+        """
+        start = time.perf_counter()
+        connection = None
         try:
-            status = self.java_server.status()
-            return {
-                'online': self.java_server.ping() is not None,
+            connection = StatusConnection(self.address, self.connect_timeout, self.read_timeout)
+            pinger = ServerPinger(connection, address=self.address)
+            pinger.handshake()
+            status_start = time.perf_counter()
+            status = pinger.read_status()
+            latency_ms = (time.perf_counter() - status_start) * 1000
+            result = {
+                'online': True,
                 'players_online': status.players.online,
-                'version': status.version.name
+                'version': status.version.name,
+                'latency_ms': round(latency_ms, 3),
+                'timed_out': False
             }
         except Exception as e:
             self.logger.warning(f"Warning: Could not check the Minecraft server. Maybe its offline? Error: '{str(e)}'.")
-            return {
+            result = {
                 'online': False,
                 'players_online': 0,
-                'version': 'unknown'
+                'version': 'unknown',
+                'latency_ms': None,
+                'timed_out': isinstance(e, socket.timeout) # No answer, unlike a refused connection the server may be up
             }
+        finally:
+            if connection is not None:
+                connection.socket.close()
+
+        result['probe_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        self.logger.info(f"Minecraft server {self.server_address} probe: online={result['online']}, rtt={result['latency_ms']} ms, took {result['probe_ms']} ms")
+        return result
@@ -0,0 +1,65 @@
+import json
+import re
+from typing import Dict, Any
+from .logger import setup_logging
+from .ssm import SSMUtil
+
+DEFAULT_SERVER_ID = "default" # The server the deployment's own environment variables describe
+SERVER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,24}$") # Short enough to fit in an ECS startedBy value
+TEC_ACTIONS = ("start", "stop", "mc_world_archive") # Actions that run Terraform in the TEC
+
+class ServerRegistry:
+    """
+    Configuration of every Minecraft server run from this API.
+
+    The registry is a JSON object of {server_id: {ENV_VAR: value}}, read from an SSM parameter when
+    `registry_param_name` is set, otherwise from `registry_json`. A server's values override the deployment's
+    environment variables. The default server uses the environment as is, and every other server gets
+    its own bot command parameter, so queues, locks and snapshots are kept per server.
+
+    The TEC applies and destroys the deployment's single minecraft_infrastructure workspace, so only the
+    default server can run TEC actions. Other servers can be queried and publish snapshots, and are refused
+    start, stop and archive until each server has its own Terraform workspace.
+    """
+    def __init__(self, ssm: SSMUtil = None, registry_param_name: str = "", registry_json: str = "{}"):
+        self.logger = setup_logging() # Setting up logging
+        self.ssm = ssm
+        self.registry_param_name = registry_param_name
+        self.registry_json = registry_json
+
+    def servers(self) -> Dict[str, Dict[str, str]]:
+        raw = self.ssm.get_param(self.registry_param_name) if self.registry_param_name else self.registry_json
+        try:
+            servers = json.loads(raw or "{}")
+        except json.JSONDecodeError:
+            raise ValueError("Error decoding the server registry. Ensure it's a valid JSON object.")
+        if not isinstance(servers, dict):
+            raise ValueError("The server registry must be a JSON object of server_id -> settings")
+        return servers
+
+    def resolve(self, server_id: str, base_envs: Dict[str, Any], action: str = None) -> Dict[str, Any]:
+        """
+        Return the environment variables of a server. Raises ValueError for an unknown server, or for a
+        TEC action on a server other than the default one.
+        """
+        server_id = server_id or DEFAULT_SERVER_ID
+        if not isinstance(server_id, str) or not SERVER_ID_PATTERN.match(server_id):
+            raise ValueError(f"Invalid server_id: {server_id}")
+
+        servers = self.servers()
+        if server_id not in servers and server_id != DEFAULT_SERVER_ID:
+            raise ValueError(f"Unknown server_id: {server_id}")
+        if action in TEC_ACTIONS and server_id != DEFAULT_SERVER_ID:
+            # Its TEC would run against the default server's Terraform state
+            raise ValueError(f"'{action}' is only supported for the '{DEFAULT_SERVER_ID}' server, '{server_id}' has no Terraform workspace of its own")
+
+        overrides = servers.get(server_id, {})
+        unknown_vars = set(overrides) - set(base_envs)
+        if unknown_vars:
+            raise ValueError(f"Server '{server_id}' sets unknown variables: {', '.join(sorted(unknown_vars))}")
+
+        envs = {**base_envs, "SERVER_ID": server_id, "TAG_SERVER_ID": server_id}
+        if server_id != DEFAULT_SERVER_ID:
+            envs["BOT_COMMAND_NAME"] = f"{base_envs['BOT_COMMAND_NAME']}_{server_id}"
+        envs.update(overrides)
+        return envs
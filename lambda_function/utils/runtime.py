@@ -0,0 +1,72 @@
+import time
+import boto3
+from botocore.config import Config
+from typing import Dict, Any
+from .env_manager import EnvironmentVariables
+from .ssm import ParameterStore, LocalSSMClient
+from .logger import setup_logging
+
+class RuntimeContext:
+    """
+    State that lives for the whole Lambda execution environment and is reused by warm invocations:
+    the logger, pooled boto3 clients and the validated environment variables.
+    """
+    def __init__(self, init_start=None):
+        # init_start lets the caller include its own module import time in the cold start figure
+        init_start = init_start if init_start is not None else time.perf_counter()
+        self.logger = setup_logging() # Setting up logging
+        self.clients: Dict[str, Any] = {}
+        self.env_vars: Dict[str, Any] = None
+        self.parameter_store: ParameterStore = None
+        self.invocations = 0
+        self.cold_init_ms = (time.perf_counter() - init_start) * 1000
+
+    def get_client(self, service: str):
+        """
+        Return a boto3 client for the service, creating it on first use.
+        """
+        if service not in self.clients:
+            # Throttled calls, e.g. bursts of SSM writes by the launch lock and job queue, are retried with backoff
+            self.clients[service] = boto3.client(service, config=Config(retries={"mode": "adaptive", "max_attempts": 5}))
+        return self.clients[service]
+
+    def get_parameter_store(self, ttl: float = 30, backend: str = "aws") -> ParameterStore:
+        """
+        Return the SSM parameter store, whose cache is shared by warm invocations.
+        The "local" backend keeps parameters in memory instead of SSM.
+        """
+        if self.parameter_store is None:
+            client = LocalSSMClient() if backend == "local" else self.get_client('ssm')
+            self.parameter_store = ParameterStore(client, ttl)
+        return self.parameter_store
+
+    def get_envs(self, action: str) -> Dict[str, Any]:
+        """
+        Return the environment variables for the action. They are parsed and validated on the
+        first invocation, later invocations only swap in the running command tag.
+        """
+        if self.env_vars is None:
+            self.env_vars = EnvironmentVariables(action).get_vars()
+        return {**self.env_vars, 'TAG_RUNNING_COMMAND': action}
+
+    def start_invocation(self) -> Dict[str, Any]:
+        """
+        Register a new invocation and return whether it runs on a cold or warm execution environment.
+        """
+        self.invocations += 1
+        return {
+            "cold_start": self.invocations == 1,
+            "invocation": self.invocations,
+            "cold_init_ms": round(self.cold_init_ms, 3)
+        }
+
+_runtime_context = None
+
+def get_runtime_context(init_start=None) -> RuntimeContext:
+    """
+    Return the execution environment's RuntimeContext, building it on the first call.
+    """
+    global _runtime_context
+    if _runtime_context is None:
+        _runtime_context = RuntimeContext(init_start)
+    return _runtime_context
@@ -1,21 +1,249 @@
+import time
+import threading
 import boto3
+from botocore.exceptions import ClientError
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
 from .logger import setup_logging
+from .metrics import span
 
-class SSMUtil:
+class ParameterNotFoundError(Exception):
+    """
+    Raised when SSM Parameter Store has no parameter with the requested name.
+    `values` holds the parameters of the same read that were found.
+    """
+    def __init__(self, names, values=None):
+        super().__init__(f"SSM parameters not found: {', '.join(names)}")
+        self.names = names
+        self.values = values or {}
+
+class ParameterStore:
+    """
+    Reads SSM parameters with batched GetParameters calls and caches the decrypted values in memory.
+
+    Cached values expire after `ttl` seconds. A caller that knows a parameter's latest version can pass
+    it as a minimum version to bypass an older cached value. Writes invalidate the cached entry.
+    """
+    MAX_NAMES_PER_CALL = 10 # GetParameters accepts at most 10 names per call
+
+    def __init__(self, client=None, ttl: float = 30):
+        self.logger = setup_logging() # Setting up logging
+        self.client = client or boto3.client('ssm')
+        self.ttl = ttl
+        self.cache: Dict[str, Dict] = {} # name -> {"value", "version", "expires_at"}
+        self.calls = Counter() # Number of SSM calls made, by operation
+        self.lock = threading.Lock() # Guards the cache, never held across an SSM call
+        self.in_flight: Dict[str, Dict] = {} # name -> {"done", "values", "missing"} of the fetch getting it
+        self.generations = Counter() # name -> number of invalidations, a fetch overlapping one doesn't cache its value
+
+    def get(self, name: str, max_age: Optional[float] = None, min_version: Optional[int] = None) -> str:
+        min_versions = {name: min_version} if min_version is not None else None
+        return self.get_many([name], max_age, min_versions)[name]
+
+    def get_many(self, names: Iterable[str], max_age: Optional[float] = None, min_versions: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+        """
+        Return the values of the named parameters, fetching the ones that aren't cached in as few calls as possible.
+
+        The lock only guards the cache, GetParameters runs outside it. A parameter already being fetched by
+        another thread is waited for instead of fetched again, unless the read needs a newer value than
+        that fetch may return (max_age=0 or a minimum version).
+
+        :param max_age: Override the store's ttl for this read, 0 always fetches.
+        :param min_versions: Minimum acceptable version per parameter name.
+        """
+        names = list(dict.fromkeys(names))
+        min_versions = min_versions or {}
+        now = time.monotonic()
+
+        values = {}
+        to_fetch = []
+        to_join = [] # (name, in-flight fetch)
+        with self.lock:
+            for name in names:
+                entry = self.cache.get(name)
+                if entry is not None and self._is_fresh(entry, now, max_age) and entry["version"] >= min_versions.get(name, 0):
+                    values[name] = entry["value"]
+                elif name in self.in_flight and max_age != 0 and name not in min_versions:
+                    to_join.append((name, self.in_flight[name]))
+                else:
+                    to_fetch.append(name)
+            if to_fetch:
+                flight = { "done": threading.Event(), "values": {}, "missing": [] }
+                for name in to_fetch:
+                    self.in_flight[name] = flight
+
+        missing = []
+        if to_fetch:
+            try:
+                flight["values"], flight["missing"] = self._fetch(to_fetch)
+            finally:
+                with self.lock:
+                    for name in to_fetch:
+                        if self.in_flight.get(name) is flight:
+                            del self.in_flight[name]
+                flight["done"].set()
+            values.update(flight["values"])
+            missing.extend(flight["missing"])
+            self.logger.info(f"SSM: fetched {len(to_fetch)} parameters in {self._batches(len(to_fetch))} GetParameters calls, "
+                             f"{len(names) - len(to_fetch) - len(to_join)} served from cache (total calls: {dict(self.calls)})")
+
+        retry = []
+        for name, other in to_join:
+            other["done"].wait()
+            if name in other["values"]:
+                values[name] = other["values"][name]
+            elif name in other["missing"]:
+                missing.append(name)
+            else:
+                retry.append(name) # The other fetch failed
+        if retry:
+            fetched, not_found = self._fetch(retry)
+            values.update(fetched)
+            missing.extend(not_found)
+
+        if missing:
+            raise ParameterNotFoundError(missing, values)
+        return values
+
+    def get_versioned(self, name: str) -> Tuple[str, int]:
+        """
+        Read a parameter from SSM, bypassing the cache, and return (value, version).
+        """
+        with span("ssm.get_parameters"):
+            response = self.client.get_parameters(Names=[name], WithDecryption=True)
+        with self.lock:
+            self.calls["get_parameters"] += 1
+        if not response.get("Parameters"):
+            raise ParameterNotFoundError([name])
+        parameter = response["Parameters"][0]
+        return parameter["Value"], parameter["Version"]
+
+    def put(self, name: str, value: str, type: str = "String", overwrite: bool = True) -> int:
+        """
+        Write a parameter and invalidate its cached value. Returns the new version.
+        """
+        with span("ssm.put_parameter"):
+            response = self.client.put_parameter(Name=name, Value=value, Type=type, Overwrite=overwrite)
+        with self.lock:
+            self.calls["put_parameter"] += 1
+        self.invalidate(name)
+        return response.get("Version", 0)
+
+    def delete(self, name: str) -> bool:
+        """
+        Delete a parameter and invalidate its cached value. Returns False if it didn't exist.
+        """
+        try:
+            with span("ssm.delete_parameter"):
+                self.client.delete_parameter(Name=name)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ParameterNotFound":
+                raise
+            return False
+        finally:
+            with self.lock:
+                self.calls["delete_parameter"] += 1
+            self.invalidate(name)
+
+    def invalidate(self, *names: str) -> None:
+        with self.lock:
+            for name in names:
+                self.cache.pop(name, None)
+                self.generations[name] += 1
+
+    def _fetch(self, names):
+        """
+        Get the parameters from SSM and cache them. Returns ({name: value}, missing names).
+        """
+        values = {}
+        missing = []
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            generations = {name: self.generations[name] for name in names}
+        for i in range(0, len(names), self.MAX_NAMES_PER_CALL):
+            with span("ssm.get_parameters"):
+                response = self.client.get_parameters(Names=names[i:i + self.MAX_NAMES_PER_CALL], WithDecryption=True)
+            with self.lock:
+                self.calls["get_parameters"] += 1
+                missing.extend(response.get("InvalidParameters", []))
+                for parameter in response.get("Parameters", []):
+                    values[parameter["Name"]] = parameter["Value"]
+                    previous = self.cache.get(parameter["Name"])
+                    if self.generations[parameter["Name"]] != generations[parameter["Name"]] or (previous is not None and previous["version"] > parameter["Version"]):
+                        continue # Written during the call, or a concurrent read already cached a newer version
+                    if previous is not None and previous["version"] != parameter["Version"]:
+                        self.logger.info(f"SSM parameter '{parameter['Name']}' changed: version {previous['version']} -> {parameter['Version']}")
+                    self.cache[parameter["Name"]] = { "value": parameter["Value"], "version": parameter["Version"], "fetched_at": time.monotonic(), "expires_at": expires_at }
+        return values, missing
+
+    def _is_fresh(self, entry, now, max_age):
+        if max_age is None:
+            return entry["expires_at"] > now
+        return now - entry["fetched_at"] < max_age
+
+    def _batches(self, count):
+        return -(-count // self.MAX_NAMES_PER_CALL)
+
+class LocalSSMClient:
+    """
+    In-memory stand-in for the boto3 SSM client, for running the Lambda without AWS.
+    Implements the calls the Lambda makes with the same versioning and errors as SSM.
+    """
     def __init__(self):
+        self.parameters: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def put_parameter(self, Name, Value, Type="String", Overwrite=False, **kwargs):
+        with self.lock:
+            current = self.parameters.get(Name)
+            if current is not None and not Overwrite:
+                raise self._error("ParameterAlreadyExists", "PutParameter", f"The parameter {Name} already exists.")
+            version = current["Version"] + 1 if current is not None else 1
+            self.parameters[Name] = { "Name": Name, "Value": Value, "Type": Type, "Version": version }
+            return { "Version": version, "Tier": "Standard" }
+
+    def get_parameter(self, Name, WithDecryption=False):
+        with self.lock:
+            if Name not in self.parameters:
+                raise self._error("ParameterNotFound", "GetParameter", f"Parameter {Name} not found.")
+            return { "Parameter": dict(self.parameters[Name]) }
+
+    def get_parameters(self, Names, WithDecryption=False):
+        with self.lock:
+            return {
+                "Parameters": [dict(self.parameters[name]) for name in Names if name in self.parameters],
+                "InvalidParameters": [name for name in Names if name not in self.parameters]
+            }
+
+    def delete_parameter(self, Name):
+        with self.lock:
+            if self.parameters.pop(Name, None) is None:
+                raise self._error("ParameterNotFound", "DeleteParameter", f"Parameter {Name} not found.")
+            return {}
+
+    def _error(self, code, operation, message):
+        return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+class SSMUtil:
+    def __init__(self, client=None, store=None):
         self.logger = setup_logging() # Setting up logging
-        self.client = boto3.client('ssm')
-
-    def send_param(self, command: str, type: str, ssm_path: str) -> None:
-        self.client.put_parameter(
-            Name=ssm_path,
-            Value=command,
-            Type=type,
-            Overwrite=True
-        )
-
-    def get_param(self, ssm_path: str) -> str:
-        response = self.client.get_parameter(Name=ssm_path, WithDecryption=True)
-        value = response["Parameter"]["Value"]
+        self.store = store or ParameterStore(client)
+        self.client = self.store.client
+
+    def send_param(self, command: str, type: str, ssm_path: str, overwrite: bool = True) -> int:
+        return self.store.put(ssm_path, command, type, overwrite)
+
+    def delete_param(self, ssm_path: str) -> bool:
+        return self.store.delete(ssm_path)
+
+    def get_param(self, ssm_path: str, max_age: Optional[float] = None) -> str:
+        value = self.store.get(ssm_path, max_age)
         self.logger.debug(f"Retrieved from SSM Parameter Store: '{value}'")
-        return value
\ No newline at end of file
+        return value
+
+    def get_param_version(self, ssm_path: str) -> Tuple[str, int]:
+        return self.store.get_versioned(ssm_path)
+
+    def get_params(self, ssm_paths: Iterable[str], max_age: Optional[float] = None) -> Dict[str, str]:
+        return self.store.get_many(ssm_paths, max_age)
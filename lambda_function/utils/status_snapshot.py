@@ -0,0 +1,67 @@
+import json
+import time
+from typing import Dict, Any, Optional
+from .logger import setup_logging
+from .ssm import SSMUtil, ParameterNotFoundError
+from .jobs import JobStore, JOBS_PARAM_SUFFIX
+
+STATUS_PARAM_SUFFIX = "_STATUS" # The snapshot lives next to the bot command parameter
+
+class StatusSnapshotStore:
+    """
+    Latest server status published by the monitoring sidecar, kept in an SSM parameter.
+
+    The sidecar publishes every CHECK_INTERVAL and bumps the snapshot's sequence number when the status
+    changes. A snapshot is only served while it is younger than `max_age` and the TEC has no queued or
+    running commands, otherwise the status is probed live. Jobs whose task died (see JobStore.is_stuck) don't count.
+    """
+    FIELDS = ("seq", "online", "players_online", "version", "timer_status", "time_without_players", "timestamp")
+
+    def __init__(self, ssm: SSMUtil, bot_command_name: str, max_age: float = 150, jobs: Optional[JobStore] = None):
+        self.logger = setup_logging() # Setting up logging
+        self.ssm = ssm
+        self.bot_command_name = bot_command_name
+        self.param_name = bot_command_name + STATUS_PARAM_SUFFIX
+        self.jobs_param_name = bot_command_name + JOBS_PARAM_SUFFIX
+        self.max_age = max_age
+        self.jobs = jobs or JobStore(ssm, bot_command_name)
+
+    def publish(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a snapshot sent by the sidecar, stamped with the time it was received.
+        """
+        if not isinstance(snapshot, dict) or not isinstance(snapshot.get("seq"), int) or "online" not in snapshot:
+            raise ValueError("Status snapshot must be an object with an integer 'seq' and 'online'")
+
+        record = {key: snapshot.get(key) for key in self.FIELDS}
+        record["received_at"] = time.time() # Ages are measured on the Lambda's clock, not the sidecar's
+        self.ssm.send_param(json.dumps(record, separators=(",", ":")), "String", self.param_name)
+        self.logger.info(f"Stored status snapshot {record['seq']}")
+        return record
+
+    def fresh(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the snapshot and the previous command if the snapshot can be served, otherwise None.
+        The snapshot, job queue and bot command are read in one GetParameters call. Only a missing
+        snapshot can't be served, no job queue means no jobs and no bot command means no previous command.
+        """
+        try:
+            values = self.ssm.get_params([self.param_name, self.jobs_param_name, self.bot_command_name], max_age=0)
+        except ParameterNotFoundError as e:
+            if self.param_name in e.names:
+                self.logger.info("No status snapshot to serve")
+                return None
+            values = e.values
+
+        snapshot = json.loads(values[self.param_name])
+        age = time.time() - snapshot["received_at"]
+        if age > self.max_age:
+            self.logger.info(f"Status snapshot {snapshot['seq']} is stale ({age:.0f}s old)")
+            return None
+
+        active_jobs = [job for job in json.loads(values.get(self.jobs_param_name, '{"jobs": []}'))["jobs"] if job["state"] in JobStore.ACTIVE_STATES and not self.jobs.is_stuck(job)]
+        if active_jobs:
+            self.logger.info(f"Status snapshot {snapshot['seq']} skipped, the TEC has {len(active_jobs)} active jobs")
+            return None
+
+        return { "snapshot": {**snapshot, "age": round(age, 3)}, "prev_command": values.get(self.bot_command_name) }
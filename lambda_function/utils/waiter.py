@@ -0,0 +1,39 @@
+import random
+import time
+from typing import Callable, Dict, Any, Tuple
+from .logger import setup_logging
+
+class StateWaiter:
+    """
+    Polls a state until it reaches a target or `timeout` seconds pass.
+
+    Polls back off exponentially from `initial_delay` up to `max_delay` seconds, with jitter so
+    held requests watching the same state don't poll in lockstep.
+    """
+    def __init__(self, timeout: float, initial_delay: float = 1, max_delay: float = 5, backoff: float = 1.5):
+        self.logger = setup_logging() # Setting up logging
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+
+    def wait(self, observe: Callable[[], Tuple[bool, Any]]) -> Dict[str, Any]:
+        """
+        Call observe() until it reports the target as reached. It returns (reached, observed state).
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        delay = self.initial_delay
+        polls = 0
+        while True:
+            reached, state = observe()
+            polls += 1
+            remaining = deadline - time.monotonic()
+            if reached or remaining <= 0:
+                break
+            time.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+            delay = min(delay * self.backoff, self.max_delay)
+
+        waited = round(time.monotonic() - start, 3)
+        self.logger.info(f"Wait {'reached its target' if reached else 'timed out'} after {polls} polls in {waited}s, last state: {state}")
+        return { "reached": reached, "state": state, "polls": polls, "waited_s": waited }
@@ -12,6 +12,8 @@ git_private_key_name="$2"
 aws_region="$3"
 api_url="$4"
 rcon_port="$5"
+server_id="${6:-default}" # The server's id in the API's registry, used by the monitoring sidecar
+auth_token_name="${7:-}" # SSM parameter holding the API's token keyring, empty when the API isn't authorized
 
 echo "=== Configuration Parameters ==="
 echo "S3 Bucket Path: $s3_bucket_path"
@@ -19,10 +21,12 @@ echo "Git Private Key Name: $git_private_key_name"
 echo "AWS Region: $aws_region"
 echo "API URL: $api_url"
 echo "RCON Port: $rcon_port"
+echo "Server ID: $server_id"
+echo "Auth Token Name: ${auth_token_name:-none}"
 echo "==============================="
 
-if [[ $# -ne 5 ]]; then
-  echo "Usage: $0 <s3_bucket_path> <git_private_key_name> <aws_region> <api_url> <rcon_port>"
+if [[ $# -lt 5 || $# -gt 7 ]]; then
+  echo "Usage: $0 <s3_bucket_path> <git_private_key_name> <aws_region> <api_url> <rcon_port> [server_id] [auth_token_name]"
   exit 1
 fi
 
@@ -39,6 +43,8 @@ create_env_file() {
     local directory=$1
     local api_url=$2
     local rcon_port=$3
+    local server_id=$4
+    local api_token=$5
     local promtheus_port="9200" # To be replaced by a parameter from terraform files
     local env_file_path="$directory/.env"
 
@@ -47,6 +53,8 @@ create_env_file() {
     env_variables["API_URL"]="$api_url"
     env_variables["RCON_PORT"]="$rcon_port"
     env_variables["PROMETHEUS_PORT"]="$promtheus_port"
+    env_variables["SERVER_ID"]="$server_id"
+    env_variables["API_TOKEN"]="$api_token"
 
     # Create the .env file
     echo "# Generated .env file" > "$env_file_path"
@@ -54,6 +62,7 @@ create_env_file() {
         echo "$key=${env_variables[$key]}" >> "$env_file_path"
     done
 
+    chmod 600 "$env_file_path" # Holds the API token
     echo ".env file created at $env_file_path"
 }
 
@@ -91,6 +100,16 @@ function mc_server_icon() {
   sed -i.bak "s|xxICONxx|$icon_url|g" "${docker_compose_file_path}"
 }
 
+function get_api_token {
+  # First token of the keyring, a JSON list or comma/newline separated tokens
+  if [[ -z "$auth_token_name" ]]; then
+    return 0
+  fi
+  local keyring
+  keyring=$(aws ssm get-parameter --name "$auth_token_name" --with-decryption --region "$aws_region" --query "Parameter.Value" --output text) || error_handler "Failed to fetch the API token"
+  echo "$keyring" | tr -d '[]" ' | tr '\n' ',' | cut -d ',' -f 1
+}
+
 function setup_git_creds {
   ssh_key_file=$(mktemp)
   aws ssm get-parameter --name "$git_private_key_name" --with-decryption --region "$aws_region" --query "Parameter.Value" --output text > "$ssh_key_file" || error_handler "Failed to fetch SSH key"
@@ -121,11 +140,14 @@ function setup_docker_environment {
   local docker_folder="$1"
   local api_url="$2"
   local rcon_port="$3"
+  local server_id="$4"
+  local api_token
 
   echo "Setting up docker environment"
+  api_token=$(get_api_token)
 
   # Create .env file for server monitoring
-  create_env_file "$docker_folder" "$api_url" "$rcon_port"
+  create_env_file "$docker_folder" "$api_url" "$rcon_port" "$server_id" "$api_token"
 
   # Choose a random server image
   mc_server_icon "$docker_folder/docker-compose.yml"
@@ -186,7 +208,7 @@ function run {
   setup_minecraft_world "$s3_bucket_path" "$home_dir" "$mc_map_repo_folder"
 
   # Setup Docker environment
-  setup_docker_environment "$docker_folder" "$api_url" "$rcon_port"
+  setup_docker_environment "$docker_folder" "$api_url" "$rcon_port" "$server_id"
 
   # Run Docker Compose
   run_docker_compose "$docker_compose_file"